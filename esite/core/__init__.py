@@ -0,0 +1 @@
+default_app_config = "esite.core.apps.CoreConfig"
@@ -3,7 +3,10 @@ from django.apps import AppConfig
 
 # This defines the name of the app.
 class CoreConfig(AppConfig):
-    name = "core"
+    name = "esite.core"
+
+    def ready(self):
+        from . import signals  # noqa
 
 
 # SPDX-License-Identifier: (EUPL-1.2)
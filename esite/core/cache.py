@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class IdSetCache:
+    """Process-wide set of ids, loaded with a single query.
+
+    `queryset_fn` returns a flat values_list of the ids. The set is kept
+    warm with `add` and `discard`, usually from post_save and post_delete
+    signals, and reloaded every `refresh_interval` seconds to pick up
+    changes of other processes. Adds and discards that happen while a
+    load is running are applied to the loaded ids, the query might not
+    have seen them.
+    """
+
+    # ctor
+    def __init__(
+        self, queryset_fn: object, refresh_setting: str, refresh_interval: float = None
+    ) -> None:
+        self.queryset_fn = queryset_fn
+        self.refresh_interval = refresh_interval or getattr(
+            settings, refresh_setting, 300
+        )
+        self._ids = set()
+        self._loaded_at = None
+        # {id: True if added, False if discarded} of every running load
+        self._loads = []
+        self._lock = threading.Lock()
+
+    # props
+    @property
+    def is_fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < self.refresh_interval
+        )
+
+    # meths
+    def load(self) -> None:
+        changes = {}
+
+        with self._lock:
+            self._loads.append(changes)
+
+        try:
+            ids = set(self.queryset_fn().iterator())
+        finally:
+            with self._lock:
+                self._loads.remove(changes)
+
+        with self._lock:
+            for id, added in changes.items():
+                if added:
+                    ids.add(id)
+                else:
+                    ids.discard(id)
+
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+
+    def get(self, id: int) -> bool:
+        """Cached answer or None if the cache has to be (re)loaded first."""
+        if not self.is_fresh:
+            return None
+
+        return id in self._ids
+
+    def __contains__(self, id: int) -> bool:
+        if not self.is_fresh:
+            self.load()
+
+        return id in self._ids
+
+    def add(self, id: int) -> None:
+        with self._lock:
+            self._ids.add(id)
+
+            for changes in self._loads:
+                changes[id] = True
+
+    def discard(self, id: int) -> None:
+        with self._lock:
+            self._ids.discard(id)
+
+            for changes in self._loads:
+                changes[id] = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids = set()
+            self._loaded_at = None
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
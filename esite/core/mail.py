@@ -0,0 +1,212 @@
+import functools
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from prometheus_client import Counter, Histogram
+
+from .models import OutgoingMail
+
+logger = logging.getLogger(__name__)
+
+MAIL_SEND_SECONDS = Histogram(
+    "mail_send_seconds", "Time spent handing one mail to the SMTP server", ["status"]
+)
+MAILS_PROCESSED = Counter(
+    "mail_processed", "Outbox mails processed by outcome", ["status"]
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_mail_template(template_name: str) -> object:
+    """Load and compile a mail template once per process."""
+    return get_template(template_name)
+
+
+def render_mail_template(template_name: str, context: dict) -> str:
+    return get_mail_template(template_name).render(context)
+
+
+def queue_mail(
+    subject: str,
+    message: str,
+    recipient_list: list,
+    from_email: str = None,
+    html_message: str = None,
+) -> OutgoingMail:
+    """Put a mail into the outbox.
+
+    Call this inside the caller's transaction, the mail is only sent by the
+    `send_queued_mail` worker once that transaction has been committed.
+    """
+    if isinstance(recipient_list, str):
+        recipient_list = [recipient_list]
+
+    return OutgoingMail.objects.create(
+        subject=subject,
+        message=message,
+        html_message=html_message or "",
+        from_email=from_email or "",
+        recipients=json.dumps(list(recipient_list)),
+    )
+
+
+class MailOutbox:
+    """Drain the outbox over one long-lived SMTP connection.
+
+    Mails are claimed in a short transaction and leased for `lease`
+    seconds, they are sent outside of any transaction and each outcome is
+    saved on its own. A mail whose sender died is claimed again once its
+    lease has expired.
+    """
+
+    # fields
+    batch_size: int = 50
+    max_attempts: int = 8
+    # Seconds, doubled for every failed attempt
+    base_backoff: float = 30.0
+    max_backoff: float = 3600.0
+    lease: float = 600.0
+
+    # ctor
+    def __init__(self, batch_size: int = None, max_attempts: int = None) -> None:
+        self.batch_size = batch_size or self.batch_size
+        self.max_attempts = max_attempts or self.max_attempts
+        self._connection = None
+
+    # meths
+    @property
+    def connection(self) -> object:
+        if self._connection is None:
+            self._connection = get_connection(fail_silently=False)
+            self._connection.open()
+
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def build_message(self, mail: OutgoingMail) -> EmailMultiAlternatives:
+        message = EmailMultiAlternatives(
+            subject=mail.subject,
+            body=mail.message,
+            from_email=mail.from_email or settings.DEFAULT_FROM_EMAIL,
+            to=json.loads(mail.recipients),
+            connection=self.connection,
+        )
+
+        if mail.html_message:
+            message.attach_alternative(mail.html_message, "text/html")
+
+        return message
+
+    @transaction.atomic
+    def claim(self) -> list:
+        now = timezone.now()
+
+        # Concurrent senders skip rows that are already being claimed
+        mails = list(
+            OutgoingMail.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=[OutgoingMail.PENDING, OutgoingMail.SENDING],
+                next_attempt_at__lte=now,
+            )
+            .order_by("next_attempt_at")[: self.batch_size]
+        )
+
+        for mail in mails:
+            mail.status = OutgoingMail.SENDING
+            mail.attempts += 1
+            mail.next_attempt_at = now + timedelta(seconds=self.lease)
+
+        OutgoingMail.objects.bulk_update(
+            mails, ["status", "attempts", "next_attempt_at"]
+        )
+
+        return mails
+
+    def send_batch(self) -> int:
+        """Send one batch of due mails and return how many were processed."""
+        mails = self.claim()
+
+        for mail in mails:
+            self.send(mail)
+
+        return len(mails)
+
+    def send(self, mail: OutgoingMail) -> None:
+        started = time.perf_counter()
+
+        try:
+            self.build_message(mail).send()
+        except Exception as e:
+            MAIL_SEND_SECONDS.labels(status="error").observe(
+                time.perf_counter() - started
+            )
+
+            # The connection might be broken, reconnect for the next mail
+            self.close()
+
+            mail.last_error = repr(e)
+
+            if mail.attempts >= self.max_attempts:
+                mail.status = OutgoingMail.FAILED
+                MAILS_PROCESSED.labels(status="failed").inc()
+                logger.error("Giving up on mail %s: %r", mail.pk, e)
+            else:
+                backoff = min(
+                    self.base_backoff * 2 ** (mail.attempts - 1), self.max_backoff
+                )
+                mail.status = OutgoingMail.PENDING
+                mail.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+                MAILS_PROCESSED.labels(status="retry").inc()
+                logger.warning("Sending mail %s failed, retrying: %r", mail.pk, e)
+        else:
+            MAIL_SEND_SECONDS.labels(status="sent").observe(
+                time.perf_counter() - started
+            )
+            MAILS_PROCESSED.labels(status="sent").inc()
+
+            mail.status = OutgoingMail.SENT
+            mail.sent_at = timezone.now()
+            mail.last_error = ""
+
+        mail.save(
+            update_fields=[
+                "status",
+                "attempts",
+                "next_attempt_at",
+                "last_error",
+                "sent_at",
+            ]
+        )
+
+    def run(self, poll_interval: float = 5.0) -> None:
+        try:
+            while True:
+                close_old_connections()
+                processed = self.send_batch()
+
+                if processed == 0:
+                    # Do not hold an idle SMTP connection open forever
+                    self.close()
+
+                if processed < self.batch_size:
+                    time.sleep(poll_interval)
+        finally:
+            self.close()
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
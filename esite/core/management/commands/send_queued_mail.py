@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from prometheus_client import start_http_server
+
+from esite.core.mail import MailOutbox
+
+
+class Command(BaseCommand):
+    help = "Send the mails waiting in the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send one batch and exit instead of polling forever.",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--max-attempts", type=int, default=None)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when the outbox is drained.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=None,
+            help="Serve Prometheus metrics on this local port.",
+        )
+
+    def handle(self, *args, **options):
+        outbox = MailOutbox(
+            batch_size=options["batch_size"], max_attempts=options["max_attempts"]
+        )
+
+        if options["once"]:
+            try:
+                self.stdout.write(f"Processed {outbox.send_batch()} mails.")
+            finally:
+                outbox.close()
+            return
+
+        if options["metrics_port"]:
+            start_http_server(options["metrics_port"], addr="127.0.0.1")
+
+        outbox.run(poll_interval=options["poll_interval"])
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
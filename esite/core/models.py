@@ -4,6 +4,7 @@
 # Copyright © 2021 snek.at
 
 from django.db import models
+from django.utils import timezone
 from wagtail.contrib.settings.models import BaseSetting, register_setting
 from bifrost.api.models import (
     GraphQLCollection,
@@ -103,5 +104,41 @@ class SnekSettings(BaseSetting):
     ]
 
 
+class OutgoingMail(models.Model):
+    """A mail waiting in the outbox, sent by the `send_queued_mail` command."""
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField(blank=True)
+    html_message = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255, blank=True)
+    recipients = models.TextField(help_text="JSON list of recipient addresses.")
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Also the lease of a mail being sent, it is claimed again after a crash
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outgoing Mail"
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+
+
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import SnekSettings
+from .snapshot import broadcast_invalidation, update_snapshot
+
+
+@receiver(post_save, sender=SnekSettings)
+def rebuild_snek_settings_snapshot(sender, instance, **kwargs):
+    def rebuild():
+        update_snapshot(instance)
+        broadcast_invalidation(instance.site_id)
+
+    # Rolled back saves must neither reach this nor any other process
+    transaction.on_commit(rebuild)
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+import uuid
+from dataclasses import dataclass
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Channel layer group every process listens on for settings changes
+INVALIDATION_GROUP = "snek-settings"
+
+# Lets a process ignore its own broadcasts
+_PROCESS_ID = uuid.uuid4().hex
+
+_ID_PATTERN = re.compile(r"-?\d+")
+
+
+def _parse_ids(value: str) -> tuple:
+    """Parse chat or user ids from a free-form field, e.g. "1, -1002" or "[1]"."""
+    return tuple(int(match) for match in _ID_PATTERN.findall(value or ""))
+
+
+def _parse_blacklist(value: str) -> frozenset:
+    try:
+        blacklist = json.loads(value or "{}").get("blacklist", [])
+    except (ValueError, AttributeError):
+        logger.warning("SnekSettings.blacklist is not valid JSON, ignoring it.")
+        blacklist = []
+
+    return frozenset(str(matrikelnummer) for matrikelnummer in blacklist)
+
+
+@dataclass(frozen=True)
+class SnekSettingsSnapshot:
+    """Parsed, immutable copy of the SnekSettings of one site."""
+
+    site_id: int
+    snek_name: str = ""
+    bot_id: str = ""
+    group_ids: tuple = ()
+    admins: tuple = ()
+    from_address: str = ""
+    debug_address: str = ""
+    blacklist: frozenset = frozenset()
+
+    @classmethod
+    def from_settings(cls, snek_settings: object) -> "SnekSettingsSnapshot":
+        return cls(
+            site_id=snek_settings.site_id,
+            snek_name=snek_settings.snek_name,
+            bot_id=snek_settings.bot_id,
+            group_ids=_parse_ids(snek_settings.group_ids),
+            admins=_parse_ids(snek_settings.admins),
+            from_address=snek_settings.from_address,
+            debug_address=snek_settings.debug_addres,
+            blacklist=_parse_blacklist(snek_settings.blacklist),
+        )
+
+    def is_blacklisted(self, matrikelnummer: str) -> bool:
+        return str(matrikelnummer) in self.blacklist
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+
+_snapshots: dict = {}
+_lock = threading.Lock()
+_listener: threading.Thread = None
+
+
+def get_snek_settings(site_id: int = 1) -> SnekSettingsSnapshot:
+    """Return the cached snapshot, loading it on first access only."""
+    snapshot = _snapshots.get(site_id)
+
+    if snapshot is None:
+        from .models import SnekSettings
+
+        _start_listener()
+
+        snapshot = SnekSettingsSnapshot.from_settings(SnekSettings.for_site(site_id))
+
+        with _lock:
+            _snapshots[site_id] = snapshot
+
+    return snapshot
+
+
+def update_snapshot(snek_settings: object) -> None:
+    with _lock:
+        _snapshots[snek_settings.site_id] = SnekSettingsSnapshot.from_settings(
+            snek_settings
+        )
+
+
+def invalidate(site_id: int = None) -> None:
+    with _lock:
+        if site_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(site_id, None)
+
+
+def broadcast_invalidation(site_id: int) -> None:
+    """Tell every other process to drop its snapshot."""
+    from channels.layers import get_channel_layer
+
+    channel_layer = get_channel_layer()
+
+    if channel_layer is None:
+        return
+
+    try:
+        async_to_sync(channel_layer.group_send)(
+            INVALIDATION_GROUP,
+            {
+                "type": "snek_settings.invalidate",
+                "site_id": site_id,
+                "origin": _PROCESS_ID,
+            },
+        )
+    except Exception as e:
+        logger.warning("Could not broadcast SnekSettings invalidation: %r", e)
+
+
+async def listen_for_invalidations(channel_layer: object) -> None:
+    channel = await channel_layer.new_channel()
+
+    while True:
+        # Group memberships expire, so renew it regularly
+        await channel_layer.group_add(INVALIDATION_GROUP, channel)
+
+        try:
+            message = await asyncio.wait_for(
+                channel_layer.receive(channel),
+                timeout=getattr(channel_layer, "group_expiry", 86400) / 2,
+            )
+        except asyncio.TimeoutError:
+            continue
+
+        if (
+            message.get("type") == "snek_settings.invalidate"
+            and message.get("origin") != _PROCESS_ID
+        ):
+            invalidate(message.get("site_id"))
+
+
+def _run_listener() -> None:
+    from channels.layers import get_channel_layer
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    while True:
+        try:
+            loop.run_until_complete(listen_for_invalidations(get_channel_layer()))
+        except Exception as e:
+            # Without the listener snapshots could go stale, so drop them
+            logger.warning("SnekSettings listener failed, retrying: %r", e)
+            invalidate()
+            loop.run_until_complete(asyncio.sleep(5))
+
+
+def _start_listener() -> None:
+    global _listener
+
+    if _listener is not None or not getattr(settings, "CHANNEL_LAYERS", None):
+        return
+
+    with _lock:
+        if _listener is None:
+            _listener = threading.Thread(
+                name="snek-settings-listener", target=_run_listener, daemon=True
+            )
+            _listener.start()
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
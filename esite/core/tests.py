@@ -1,4 +1,137 @@
-# Create your tests here.
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .cache import IdSetCache
+from .mail import MailOutbox, queue_mail
+from .models import OutgoingMail
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPServerDisconnected("Connection unexpectedly closed")
+
+
+class MailOutboxTest(TestCase):
+    def setUp(self):
+        self.mail = queue_mail("Aktivierung", "Hallo", "e11700000@student.tuwien.ac.at")
+
+    def make_due(self):
+        OutgoingMail.objects.update(next_attempt_at=timezone.now())
+
+    def test_send(self):
+        self.assertEqual(MailOutbox().send_batch(), 1)
+
+        self.mail.refresh_from_db()
+        self.assertEqual(self.mail.status, OutgoingMail.SENT)
+        self.assertEqual(self.mail.attempts, 1)
+        self.assertIsNotNone(self.mail.sent_at)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["e11700000@student.tuwien.ac.at"])
+
+    def test_retry_with_backoff(self):
+        outbox = MailOutbox()
+
+        with override_settings(EMAIL_BACKEND=f"{__name__}.FailingEmailBackend"):
+            self.assertEqual(outbox.send_batch(), 1)
+
+        self.mail.refresh_from_db()
+        self.assertEqual(self.mail.status, OutgoingMail.PENDING)
+        self.assertEqual(self.mail.attempts, 1)
+        self.assertIn("SMTPServerDisconnected", self.mail.last_error)
+        self.assertGreater(
+            self.mail.next_attempt_at,
+            timezone.now() + timedelta(seconds=outbox.base_backoff - 5),
+        )
+
+        # Not due before the backoff is over
+        self.assertEqual(outbox.send_batch(), 0)
+
+        self.make_due()
+        self.assertEqual(outbox.send_batch(), 1)
+
+        self.mail.refresh_from_db()
+        self.assertEqual(self.mail.status, OutgoingMail.SENT)
+        self.assertEqual(self.mail.attempts, 2)
+        self.assertEqual(self.mail.last_error, "")
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_BACKEND=f"{__name__}.FailingEmailBackend")
+    def test_give_up(self):
+        outbox = MailOutbox(max_attempts=2)
+
+        for _ in range(2):
+            self.make_due()
+            self.assertEqual(outbox.send_batch(), 1)
+
+        self.mail.refresh_from_db()
+        self.assertEqual(self.mail.status, OutgoingMail.FAILED)
+        self.assertEqual(self.mail.attempts, 2)
+
+        self.make_due()
+        self.assertEqual(outbox.send_batch(), 0)
+
+    def test_claim_leases(self):
+        outbox = MailOutbox()
+
+        self.assertEqual(len(outbox.claim()), 1)
+        # Being sent by another worker
+        self.assertEqual(outbox.claim(), [])
+
+        # The worker died, the lease expired
+        self.make_due()
+        (claimed,) = outbox.claim()
+
+        self.assertEqual(claimed.status, OutgoingMail.SENDING)
+        self.assertEqual(claimed.attempts, 2)
+
+
+class IdList(list):
+    # Quacks like a values_list queryset
+    def iterator(self):
+        return iter(self)
+
+
+class IdSetCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.ids = IdList([1, 2])
+        self.cache = IdSetCache(lambda: self.ids, "TEST_ID_CACHE_REFRESH_INTERVAL")
+
+    def test_load(self):
+        self.assertIsNone(self.cache.get(1))
+
+        self.assertIn(1, self.cache)
+        self.assertTrue(self.cache.get(2))
+        self.assertFalse(self.cache.get(3))
+
+        self.cache.add(3)
+        self.cache.discard(1)
+
+        self.assertEqual((self.cache.get(1), self.cache.get(3)), (False, True))
+
+    def test_changes_during_load(self):
+        def query():
+            # Saved and deleted by signals while the query runs
+            self.cache.add(3)
+            self.cache.discard(1)
+
+            return IdList([1, 2])
+
+        self.cache.queryset_fn = query
+        self.cache.load()
+
+        self.assertEqual(self.cache._ids, {2, 3})
+
+        # Later loads are not affected
+        self.cache.queryset_fn = lambda: self.ids
+        self.cache.load()
+
+        self.assertEqual(self.cache._ids, {1, 2})
+
 
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
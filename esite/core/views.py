@@ -1,4 +1,27 @@
-# Create your views here.
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+
+def metrics(request):
+    """Expose the metrics of this process in the Prometheus text format.
+
+    Scrapers authenticate with `Authorization: Bearer <METRICS_TOKEN>`,
+    without a METRICS_TOKEN setting the endpoint does not exist.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+
+    if not token:
+        raise Http404
+
+    scheme, _, credentials = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+
+    if scheme.lower() != "bearer" or not constant_time_compare(credentials, token):
+        return HttpResponseForbidden()
+
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
 
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
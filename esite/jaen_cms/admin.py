@@ -7,7 +7,7 @@ from wagtail.contrib.modeladmin.options import (
     ModelAdminGroup,
     modeladmin_register,
 )
-from .models import JaenAccount
+from .models import JaenAccount, JaenPublishJob
 
 
 # class HasTelegramnameFilter(SimpleListFilter):
@@ -46,14 +46,32 @@ class JaenAccountAdmin(ModelAdmin):
     exclude_from_explorer = False
 
     # Listed in the user overview
-    #list_display = ("date_joined", "matrikelnummer", "email", "telegram_username")
-    #list_filter = ("is_member", HasTelegramnameFilter)
-    #search_fields = ("date_joined", "matrikelnummer", "email", "telegram_username")
+    # list_display = ("date_joined", "matrikelnummer", "email", "telegram_username")
+    # list_filter = ("is_member", HasTelegramnameFilter)
+    # search_fields = ("date_joined", "matrikelnummer", "email", "telegram_username")
 
     # export_filename = 'people_spreadsheet'
     # list_export = ("date_joined", "matrikelnummer", "email", "telegram_username"),
 
+
 modeladmin_register(JaenAccountAdmin)
 
+
+class JaenPublishJobAdmin(ModelAdmin):
+    model = JaenPublishJob
+    menu_label = "Jaen Publishes"
+    menu_icon = "upload"
+    menu_order = 291
+    add_to_settings_menu = False
+    exclude_from_explorer = False
+
+    list_display = ("created_at", "git_remote", "status", "attempts", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("git_remote",)
+
+
+modeladmin_register(JaenPublishJobAdmin)
+
+
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
@@ -0,0 +1,248 @@
+import json
+import logging
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+GITHUB_REQUESTS = Counter(
+    "github_requests", "GitHub API requests by outcome", ["outcome"]
+)
+GITHUB_CIRCUIT_OPEN = Gauge(
+    "github_circuit_open", "Whether GitHub API calls are currently short-circuited"
+)
+
+# Connecting fails fast, GitHub takes a while to answer dispatches sometimes
+GITHUB_TIMEOUT = httpx.Timeout(10.0, connect=3.0)
+# All requests go to one host, so these are the limits for api.github.com
+GITHUB_LIMITS = httpx.Limits(
+    max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0
+)
+GITHUB_HEADERS = {
+    "Accept": "application/vnd.github.everest-preview+json",
+    "Content-Type": "application/json",
+}
+
+
+class GitHubUnavailable(Exception):
+    """GitHub is not called right now, try again in `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stop calling GitHub after repeated failures or slow responses.
+
+    After `failure_threshold` failures in a row the circuit opens and
+    calls fail with GitHubUnavailable for `reset_timeout` seconds. Then a
+    single trial call is let through, it closes the circuit again if it
+    succeeds. Server errors, network errors and responses slower than
+    `slow_threshold` seconds count as failures.
+
+    `X-RateLimit-*` headers are tracked per token, once fewer than
+    `rate_limit_reserve` requests are left calls with that token are
+    held back until the limit resets.
+    """
+
+    # fields
+    failure_threshold: int = 5
+    slow_threshold: float = 5.0
+    reset_timeout: float = 30.0
+    rate_limit_reserve: int = 10
+
+    # ctor
+    def __init__(self, **options) -> None:
+        for name, value in options.items():
+            setattr(self, name, value)
+
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        # {token: epoch seconds the rate limit resets}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+
+    # props
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    # meths
+    def before(self, token: str) -> None:
+        """Raise GitHubUnavailable if a call must not be made now."""
+        now = time.time()
+
+        with self._lock:
+            paused_until = self._paused_until.get(token, 0)
+
+            if paused_until > now:
+                GITHUB_REQUESTS.labels(outcome="rate_limited").inc()
+                raise GitHubUnavailable(
+                    "GitHub rate limit reached", retry_after=paused_until - now
+                )
+
+            self._paused_until.pop(token, None)
+
+            if self._opened_at is None:
+                return
+
+            retry_after = self._opened_at + self.reset_timeout - time.monotonic()
+
+            if retry_after > 0 or self._trial:
+                GITHUB_REQUESTS.labels(outcome="short_circuited").inc()
+                raise GitHubUnavailable(
+                    "GitHub is unavailable", retry_after=max(retry_after, 1.0)
+                )
+
+            # Half open, this call decides whether the circuit closes
+            self._trial = True
+
+    def after(
+        self, token: str, response: httpx.Response = None, elapsed: float = 0.0
+    ) -> None:
+        failed = (
+            response is None
+            or response.status_code >= 500
+            or elapsed > self.slow_threshold
+        )
+
+        if response is not None:
+            self._track_rate_limit(token, response)
+
+        with self._lock:
+            self._trial = False
+
+            if not failed:
+                if self._opened_at is not None:
+                    logger.info("GitHub recovered, closing the circuit")
+                self._failures = 0
+                self._opened_at = None
+                GITHUB_REQUESTS.labels(outcome="ok").inc()
+                return
+
+            GITHUB_REQUESTS.labels(outcome="failed").inc()
+            self._failures += 1
+
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(
+                        "Opening the GitHub circuit after %s failures", self._failures
+                    )
+                self._opened_at = time.monotonic()
+
+    def _track_rate_limit(self, token: str, response: httpx.Response) -> None:
+        headers = response.headers
+
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            remaining = reset = None
+
+        if response.status_code in (403, 429) and "Retry-After" in headers:
+            # Secondary rate limits only send Retry-After
+            try:
+                reset = time.time() + float(headers["Retry-After"])
+                remaining = 0
+            except ValueError:
+                pass
+
+        if remaining is not None and remaining <= self.rate_limit_reserve:
+            logger.warning(
+                "%s GitHub requests left, pausing until %s", remaining, reset
+            )
+
+            with self._lock:
+                self._paused_until[token] = reset
+
+
+breaker = CircuitBreaker(**getattr(settings, "JAEN_GITHUB_CIRCUIT_BREAKER", {}))
+GITHUB_CIRCUIT_OPEN.set_function(lambda: int(breaker.is_open))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_api_url() -> str:
+    # Point this at a local stand-in server for tests
+    return getattr(settings, "JAEN_GITHUB_API_URL", "https://api.github.com")
+
+
+def get_client() -> httpx.Client:
+    """Return the pooled client shared by all threads of this process."""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=get_api_url(),
+                    headers=GITHUB_HEADERS,
+                    timeout=GITHUB_TIMEOUT,
+                    limits=GITHUB_LIMITS,
+                )
+
+    return _client
+
+
+def close_clients() -> None:
+    global _client
+
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def build_dispatch(
+    git_remote: str, git_token: str, event_type: str, client_payload: dict
+) -> dict:
+    return {
+        "url": f"/repos/{git_remote}/dispatches",
+        "headers": {"Authorization": f"token {git_token}"},
+        "content": json.dumps(
+            {"event_type": event_type, "client_payload": client_payload},
+            cls=DjangoJSONEncoder,
+        ).encode("utf-8"),
+    }
+
+
+def repository_dispatch(
+    git_remote: str,
+    git_token: str,
+    event_type: str,
+    client_payload: dict,
+    timeout: float = None,
+) -> httpx.Response:
+    """Trigger a repository_dispatch event of a GitHub repository.
+
+    Raises GitHubUnavailable without calling GitHub while the circuit is
+    open or the rate limit of the token is nearly used up. `timeout`
+    overrides the read timeout for callers with a tighter latency budget.
+    """
+    request = build_dispatch(git_remote, git_token, event_type, client_payload)
+
+    if timeout is not None:
+        request["timeout"] = httpx.Timeout(timeout, connect=GITHUB_TIMEOUT.connect)
+
+    breaker.before(git_token)
+    started = time.monotonic()
+    response = None
+
+    try:
+        response = get_client().post(**request)
+    finally:
+        breaker.after(git_token, response, time.monotonic() - started)
+
+    return response
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from prometheus_client import start_http_server
+
+from esite.jaen_cms.publisher import PublishQueue
+
+
+class Command(BaseCommand):
+    help = "Dispatch the queued Jaen publishes to GitHub."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process one batch and exit instead of polling forever.",
+        )
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--max-attempts", type=int, default=None)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is drained.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=None,
+            help="Serve Prometheus metrics on this local port.",
+        )
+
+    def handle(self, *args, **options):
+        queue = PublishQueue(
+            workers=options["workers"], max_attempts=options["max_attempts"]
+        )
+
+        if options["once"]:
+            self.stdout.write(f"Processed {queue.run_once()} publish jobs.")
+            return
+
+        if options["metrics_port"]:
+            start_http_server(options["metrics_port"], addr="127.0.0.1")
+
+        queue.run(poll_interval=options["poll_interval"])
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,81 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:00
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jaen_cms", "0003_jaenaccount_encryption_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JaenPublishJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("git_remote", models.CharField(max_length=255)),
+                ("jaendata_url", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "jaen_account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="publish_jobs",
+                        to="jaen_cms.jaenaccount",
+                    ),
+                ),
+                (
+                    "page",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="publish_jobs",
+                        to="jaen_cms.jaenpublishformpage",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Jaen Publish Job",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="jaenpublishjob",
+            index=models.Index(
+                fields=["status", "next_attempt_at"],
+                name="jaen_cms_ja_status_e4102d_idx",
+            ),
+        ),
+    ]
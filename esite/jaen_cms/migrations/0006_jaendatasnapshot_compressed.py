@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jaen_cms", "0005_jaendatasnapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jaendatasnapshot",
+            name="content_br",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name="jaendatasnapshot",
+            name="content_gzip",
+            field=models.BinaryField(null=True),
+        ),
+    ]
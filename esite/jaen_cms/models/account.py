@@ -5,7 +5,7 @@ import hashlib
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
+from django.db import models, transaction
 
 from modelcluster.fields import ParentalKey
 from modelcluster.models import ClusterableModel
@@ -18,7 +18,6 @@ from wagtail.admin.edit_handlers import (
     StreamFieldPanel,
     TabbedInterface,
 )
-from wagtail.admin.mail import send_mail
 from wagtail.contrib.forms.models import (
     AbstractEmailForm,
     AbstractForm,
@@ -30,6 +29,7 @@ from wagtail.core.fields import RichTextField, StreamField
 from wagtail.core.models import Page
 from wagtail.snippets.edit_handlers import SnippetChooserPanel
 
+from esite.core.mail import queue_mail
 from bifrost.publisher.actions import register_publisher
 from bifrost.publisher.options import PublisherOptions
 from bifrost.api.models import (
@@ -249,10 +249,11 @@ class JaenRegistrationFormPage(AbstractEmailForm):
 
         # html_message = f"{emailheader}\n\n{content}\n\n{emailfooter}"
 
-        send_mail(
+        queue_mail(
             self.subject, f"{emailheader}\n\n{content}", addresses, self.from_address
         )
 
+    @transaction.atomic
     def process_form_submission(self, form):
 
         user = self.create_user(
@@ -1,6 +1,5 @@
 import json
 import uuid
-import requests
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser, BaseUserManager
@@ -48,6 +47,9 @@ from bifrost.api.models import (
     GraphQLString,
 )
 
+# Seconds an email form submission waits for GitHub
+FORM_TIMEOUT = 5
+
 # Create your email related models here.
 class JaenEmailFormField(AbstractFormField):
     page = ParentalKey(
@@ -156,21 +158,20 @@ class JaenEmailFormPage(AbstractEmailForm):
     def dispatch(
         self, user, git_remote, form_data
     ):
+        from esite.jaen_cms.github import GitHubUnavailable, repository_dispatch
+
         # Get GitHub token from jaen account
         git_token = user.jaen_account.git_token
 
-        # message = html_message
-
-        url = f"https://api.github.com/repos/{git_remote}/dispatches"
-
-        headers = requests.structures.CaseInsensitiveDict()
-        headers["Accept"] = "application/vnd.github.everest-preview+json"
-        headers["Content-Type"] = "application/x-www-form-urlencoded"
-        headers["Authorization"] = f"token {git_token}"
-
-        data = '{"event_type":"send_mail", "client_payload":' + form_data + ' }'
-
-        resp = requests.post(url, headers=headers, data=data.encode('utf-8'))
+        try:
+            # The submitter waits for this, keep it short
+            resp = repository_dispatch(
+                git_remote, git_token, "send_mail", form_data, timeout=FORM_TIMEOUT
+            )
+        except GitHubUnavailable as e:
+            raise GraphQLError(
+                f"GitHub is unavailable, try again in {int(e.retry_after) + 1} seconds"
+            )
 
         #resp.raise_for_status()
 
@@ -209,7 +210,7 @@ class JaenEmailFormPage(AbstractEmailForm):
         jaen_account = self.dispatch(
             user=user,
             git_remote=form.cleaned_data["git_remote"],
-            form_data=json.dumps(form.cleaned_data, cls=DjangoJSONEncoder),
+            form_data=form.cleaned_data,
         )
 
         self.get_submission_class().objects.create(
@@ -1,11 +1,11 @@
 import json
 import uuid
-import requests
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 from modelcluster.fields import ParentalKey
 from modelcluster.models import ClusterableModel
@@ -18,7 +18,6 @@ from wagtail.admin.edit_handlers import (
     StreamFieldPanel,
     TabbedInterface,
 )
-from wagtail.admin.mail import send_mail
 from wagtail.contrib.forms.models import (
     AbstractEmailForm,
     AbstractForm,
@@ -150,33 +149,6 @@ class JaenPublishFormPage(AbstractEmailForm):
     def get_submission_class(self):
         return JaenPublishFormSubmission
 
-    # Publish to git remote
-    def publish(
-        self, user, git_remote, jaendata_url
-    ):
-        # Get GitHub token from jaen account 
-        git_token = user.jaen_account.git_token
-        encryption_token = user.jaen_account.encryption_token
-
-        url = f"https://api.github.com/repos/{git_remote}/dispatches"
-
-        headers = requests.structures.CaseInsensitiveDict()
-        headers["Accept"] = "application/vnd.github.everest-preview+json"
-        headers["Content-Type"] = "application/x-www-form-urlencoded"
-        headers["Authorization"] = f"token {git_token}"
-
-        jaen_payload = '{"jaendata_url":"' + jaendata_url +'", "encryption_token":"' + encryption_token + '" }'
-
-        data = '{"event_type":"update-jaen-data", "client_payload":' + jaen_payload + ' }'
-        test_data = '{"event_type":"update-jaen-data", "client_payload": { "dataLayer": { "origin": { "pages": { "home": { "fields": { "body": { "blocks": { "0": { "content": "Original Heading Content", "typeName": "heading" }, "1": { "content": "<p>Original Subheading Content</p>", "typeName": "subheading" } } } }, "typeName": "HomePage" } } } }, "index": { "checksum": "d716d3da6493f8e1ad5c9dc480ea595b0402355815f25c5353c6e37413516f32d", "rootPageSlug": "home", "pages": { "home": { "slug": "home", "title": "My HomePage Updated4", "typeName": "HomePage", "childSlugs": ["blog-1"] } } } }}'
-
-
-        resp = requests.post(url, headers=headers, data=data.encode('utf-8'))
-
-        resp.raise_for_status()
-
-        return user.jaen_account
-
     # Called when a user registers
     def send_mail(self, form):
         pass
@@ -203,24 +175,109 @@ class JaenPublishFormPage(AbstractEmailForm):
         # )
 
     def process_form_submission(self, form, user, *args, **kwargs):
+        """Queue the publish and return the job id right away.
+
+        The dispatch to GitHub is done by the `run_jaen_publisher` worker,
+        clients poll the job for its outcome. Publishes of the same remote
+        in quick succession share one job.
+        """
+        from esite.jaen_cms.publisher import queue_publish
 
-        jaen_account = self.publish(
-            user=user,
-            git_remote=form.cleaned_data["git_remote"],
-            jaendata_url=form.cleaned_data["jaendata_url"],
-        )
+        jaen_account = user.jaen_account
 
         form.cleaned_data["user"] = user.username
-        form.cleaned_data["git_user"] = user.jaen_account.git_user
+        form.cleaned_data["git_user"] = jaen_account.git_user
 
-        self.get_submission_class().objects.create(
-            form_data=json.dumps(form.cleaned_data, cls=DjangoJSONEncoder),
-            page=self,
-            jaen_account=jaen_account,
-        )
+        with transaction.atomic():
+            self.get_submission_class().objects.create(
+                form_data=json.dumps(form.cleaned_data, cls=DjangoJSONEncoder),
+                page=self,
+                jaen_account=jaen_account,
+            )
+
+            job = queue_publish(
+                page=self,
+                jaen_account=jaen_account,
+                git_remote=form.cleaned_data["git_remote"],
+                jaendata_url=form.cleaned_data["jaendata_url"],
+            )
 
         if self.to_address:
             self.send_mail(form)
 
+        return job.pk
+
 class JaenPublishFormSubmission(AbstractFormSubmission):
-    jaen_account = ParentalKey("jaen_cms.JaenAccount", on_delete=models.CASCADE, related_name="publish_submissions")
\ No newline at end of file
+    jaen_account = ParentalKey("jaen_cms.JaenAccount", on_delete=models.CASCADE, related_name="publish_submissions")
+
+
+class JaenPublishJob(models.Model):
+    """A publish waiting for the `run_jaen_publisher` worker."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (UNCHANGED, "Unchanged"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    page = models.ForeignKey(
+        JaenPublishFormPage,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="publish_jobs",
+    )
+    jaen_account = models.ForeignKey(
+        "jaen_cms.JaenAccount", on_delete=models.CASCADE, related_name="publish_jobs"
+    )
+    git_remote = models.CharField(max_length=255)
+    jaendata_url = models.TextField()
+    # Of the jaen data at jaendata_url, see JaenDataSnapshot
+    checksum = models.CharField(max_length=64, blank=True)
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Also the lease of a running job, it is claimed again after a crash
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Jaen Publish Job"
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.git_remote} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.UNCHANGED, self.FAILED)
+
+
+class JaenDataSnapshot(models.Model):
+    """Jaen data as fetched by the publish worker, stored by its sha256.
+
+    Served at /jaen/data/<checksum>.json, see `esite.jaen_cms.views`.
+    """
+
+    checksum = models.CharField(max_length=64, unique=True)
+    content = models.BinaryField()
+    # Compressed once when stored, served to clients that accept them
+    content_gzip = models.BinaryField(null=True)
+    content_br = models.BinaryField(null=True)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Jaen Data Snapshot"
+
+    def __str__(self):
+        return self.checksum
@@ -0,0 +1,336 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from prometheus_client import Counter, Histogram
+
+from .github import GitHubUnavailable, repository_dispatch
+from .snapshots import (
+    fetch_jaen_data,
+    get_snapshot_url,
+    last_published_checksum,
+    store_snapshot,
+)
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_SECONDS = Histogram(
+    "jaen_publish_seconds", "Time spent dispatching one publish to GitHub", ["status"]
+)
+PUBLISH_JOBS = Counter(
+    "jaen_publish_jobs", "Publish jobs processed by outcome", ["status"]
+)
+
+
+@transaction.atomic
+def queue_publish(
+    page: object, jaen_account: object, git_remote: str, jaendata_url: str
+) -> object:
+    """Queue a publish of git_remote, coalesced with the publishes around it.
+
+    Publishes are coalesced per account and remote. A publish of the
+    account that is still waiting for the same remote takes the new
+    jaendata_url and is delayed by JAEN_PUBLISH_DEBOUNCE seconds, but at
+    most JAEN_PUBLISH_MAX_DELAY seconds after it was first queued. A job
+    waiting for a retry or for GitHub is never moved up, new data starts
+    over with its attempts. If the same data is being dispatched right now,
+    that job is returned instead.
+    """
+    from .models import JaenPublishJob
+
+    now = timezone.now()
+    debounce = timedelta(seconds=getattr(settings, "JAEN_PUBLISH_DEBOUNCE", 10))
+    max_delay = timedelta(seconds=getattr(settings, "JAEN_PUBLISH_MAX_DELAY", 60))
+
+    jobs = JaenPublishJob.objects.select_for_update().filter(
+        jaen_account=jaen_account, git_remote=git_remote
+    )
+
+    pending = jobs.filter(status=JaenPublishJob.PENDING).order_by("created_at").first()
+
+    if pending is not None:
+        if pending.attempts:
+            # Already tried, max_delay has passed long ago
+            debounced = now + debounce
+        else:
+            debounced = min(now + debounce, pending.created_at + max_delay)
+
+        if pending.jaendata_url != jaendata_url:
+            pending.attempts = 0
+            pending.last_error = ""
+
+        pending.page = page
+        pending.jaendata_url = jaendata_url
+        pending.checksum = ""
+        # Keep a retry backoff or a pause of GitHub
+        pending.next_attempt_at = max(pending.next_attempt_at, debounced)
+        pending.save(
+            update_fields=[
+                "page",
+                "jaendata_url",
+                "checksum",
+                "attempts",
+                "last_error",
+                "next_attempt_at",
+            ]
+        )
+
+        PUBLISH_JOBS.labels(status="coalesced").inc()
+
+        return pending
+
+    running = jobs.filter(
+        status=JaenPublishJob.RUNNING, jaendata_url=jaendata_url
+    ).first()
+
+    if running is not None:
+        PUBLISH_JOBS.labels(status="coalesced").inc()
+
+        return running
+
+    return JaenPublishJob.objects.create(
+        page=page,
+        jaen_account=jaen_account,
+        git_remote=git_remote,
+        jaendata_url=jaendata_url,
+        next_attempt_at=now + debounce,
+    )
+
+
+def dispatch_jaen_data(
+    jaen_account: object, git_remote: str, jaendata_url: str, checksum: str = None
+):
+    """Trigger the update-jaen-data workflow of a GitHub repository.
+
+    With a checksum the payload also points to the snapshot served by the
+    CMS, builds can fetch and revalidate it there.
+    """
+    client_payload = {
+        "jaendata_url": jaendata_url,
+        "encryption_token": jaen_account.encryption_token,
+    }
+
+    snapshot_url = get_snapshot_url(checksum) if checksum else None
+
+    if snapshot_url:
+        client_payload["jaendata_checksum"] = checksum
+        client_payload["jaendata_snapshot_url"] = snapshot_url
+
+    resp = repository_dispatch(
+        git_remote, jaen_account.git_token, "update-jaen-data", client_payload
+    )
+
+    resp.raise_for_status()
+
+    return resp
+
+
+def is_permanent(error: Exception) -> bool:
+    """Client errors like a wrong token or remote will not go away by retrying."""
+    response = getattr(error, "response", None)
+
+    if response is None:
+        return False
+
+    return 400 <= response.status_code < 500 and response.status_code != 429
+
+
+class PublishQueue:
+    """Run queued JaenPublishJobs on a pool of worker threads.
+
+    Jobs are claimed with `select_for_update(skip_locked=True)` so several
+    workers can share the queue. A claimed job is leased for `lease`
+    seconds, if its worker dies the job is claimed again after that.
+    """
+
+    # fields
+    workers: int = 4
+    max_attempts: int = 5
+    # Seconds, doubled for every failed attempt
+    base_backoff: float = 30.0
+    max_backoff: float = 1800.0
+    lease: float = 300.0
+
+    # ctor
+    def __init__(self, workers: int = None, max_attempts: int = None) -> None:
+        self.workers = workers or self.workers
+        self.max_attempts = max_attempts or self.max_attempts
+
+    # meths
+    @transaction.atomic
+    def claim(self, limit: int) -> list:
+        from .models import JaenPublishJob
+
+        now = timezone.now()
+
+        # One dispatch per account and remote at a time, the next one waits
+        busy = JaenPublishJob.objects.filter(
+            jaen_account=OuterRef("jaen_account"),
+            git_remote=OuterRef("git_remote"),
+            status=JaenPublishJob.RUNNING,
+            next_attempt_at__gt=now,
+        )
+
+        candidates = list(
+            JaenPublishJob.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("jaen_account")
+            .filter(
+                status__in=[JaenPublishJob.PENDING, JaenPublishJob.RUNNING],
+                next_attempt_at__lte=now,
+            )
+            .filter(~Exists(busy))
+            .order_by("next_attempt_at")[:limit]
+        )
+
+        jobs = {}
+        for job in candidates:
+            jobs.setdefault((job.jaen_account_id, job.git_remote), job)
+        jobs = list(jobs.values())
+
+        for job in jobs:
+            job.status = JaenPublishJob.RUNNING
+            job.attempts += 1
+            job.next_attempt_at = now + timedelta(seconds=self.lease)
+
+        JaenPublishJob.objects.bulk_update(
+            jobs, ["status", "attempts", "next_attempt_at"]
+        )
+
+        return jobs
+
+    def process(self, job: object) -> None:
+        close_old_connections()
+
+        try:
+            self.publish(job)
+        except Exception as e:
+            logger.error("Could not process publish job %s: %r", job.pk, e)
+        finally:
+            close_old_connections()
+
+    def publish(self, job: object) -> None:
+        from .models import JaenPublishJob
+
+        if not job.checksum:
+            job.checksum = self.snapshot(job)
+
+        if job.checksum and job.checksum == last_published_checksum(
+            job.git_remote, job.jaen_account
+        ):
+            # The remote was built from exactly this data already
+            job.status = JaenPublishJob.UNCHANGED
+            job.finished_at = timezone.now()
+            job.last_error = ""
+            job.save(update_fields=["checksum", "status", "finished_at", "last_error"])
+            PUBLISH_JOBS.labels(status="unchanged").inc()
+            return
+
+        started = time.perf_counter()
+
+        try:
+            dispatch_jaen_data(
+                job.jaen_account, job.git_remote, job.jaendata_url, job.checksum
+            )
+        except GitHubUnavailable as e:
+            # GitHub was not called, this does not count as an attempt
+            job.attempts -= 1
+            job.status = JaenPublishJob.PENDING
+            job.next_attempt_at = timezone.now() + timedelta(seconds=e.retry_after)
+            job.last_error = repr(e)
+            PUBLISH_JOBS.labels(status="deferred").inc()
+        except Exception as e:
+            PUBLISH_SECONDS.labels(status="error").observe(
+                time.perf_counter() - started
+            )
+
+            job.last_error = repr(e)
+
+            if is_permanent(e) or job.attempts >= self.max_attempts:
+                job.status = JaenPublishJob.FAILED
+                job.finished_at = timezone.now()
+                PUBLISH_JOBS.labels(status="failed").inc()
+                logger.error("Giving up on publish job %s: %r", job.pk, e)
+            else:
+                backoff = min(
+                    self.base_backoff * 2 ** (job.attempts - 1), self.max_backoff
+                )
+                job.status = JaenPublishJob.PENDING
+                job.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+                PUBLISH_JOBS.labels(status="retry").inc()
+                logger.warning("Publish job %s failed, retrying: %r", job.pk, e)
+        else:
+            PUBLISH_SECONDS.labels(status="done").observe(time.perf_counter() - started)
+            PUBLISH_JOBS.labels(status="done").inc()
+
+            job.status = JaenPublishJob.DONE
+            job.finished_at = timezone.now()
+            job.last_error = ""
+
+        job.save(
+            update_fields=[
+                "checksum",
+                "status",
+                "attempts",
+                "next_attempt_at",
+                "last_error",
+                "finished_at",
+            ]
+        )
+
+    @staticmethod
+    def snapshot(job: object) -> str:
+        """Fetch and store the jaen data of job, returns its checksum.
+
+        Returns an empty string if the data can not be fetched, the job is
+        dispatched without the unchanged check then.
+        """
+        try:
+            checksum, content = fetch_jaen_data(job.jaendata_url)
+            store_snapshot(checksum, content)
+        except Exception as e:
+            logger.warning("Could not fetch the jaen data of job %s: %r", job.pk, e)
+            return ""
+
+        return checksum
+
+    def run_once(self) -> int:
+        """Process one batch of due jobs and return how many there were."""
+        jobs = self.claim(self.workers)
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="jaen-publish"
+        ) as executor:
+            executor.map(self.process, jobs)
+
+        return len(jobs)
+
+    def run(self, poll_interval: float = 1.0) -> None:
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="jaen-publish"
+        ) as executor:
+            running = set()
+
+            while True:
+                close_old_connections()
+
+                free = self.workers - len(running)
+                jobs = self.claim(free) if free else []
+
+                for job in jobs:
+                    running.add(executor.submit(self.process, job))
+
+                if running:
+                    _, running = wait(
+                        running, timeout=poll_interval, return_when=FIRST_COMPLETED
+                    )
+                else:
+                    time.sleep(poll_interval)
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
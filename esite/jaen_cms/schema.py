@@ -12,7 +12,7 @@ from graphql_jwt.decorators import (
     superuser_required,
 )
 
-from esite.jaen_cms.models import JaenAccount
+from esite.jaen_cms.models import JaenAccount, JaenPublishJob
 
 class JaenAccountType(DjangoObjectType):
     class Meta:
@@ -24,10 +24,32 @@ class JaenAccountType(DjangoObjectType):
     def resolve_is_snek_supervisor(instance, info, **kwargs):
         return instance.is_snek_supervisor(info)
 
+class JaenPublishJobType(DjangoObjectType):
+    class Meta:
+        model = JaenPublishJob
+        fields = [
+            "id",
+            "git_remote",
+            "status",
+            "checksum",
+            "attempts",
+            "created_at",
+            "finished_at",
+        ]
+
 class Query(graphene.ObjectType):
     my_jaen_account = graphene.Field(
         JaenAccountType, token=graphene.String(required=False)
     )
+    jaen_publish_job = graphene.Field(
+        JaenPublishJobType, id=graphene.UUID(required=True)
+    )
+
+    @login_required
+    def resolve_jaen_publish_job(self, info, id, **_kwargs):
+        return JaenPublishJob.objects.filter(
+            pk=id, jaen_account__user=info.context.user
+        ).first()
 
     @login_required
     def resolve_my_jaen_account(self, info, **_kwargs):
@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import ipaddress
+import logging
+import socket
+import threading
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http.request import validate_host
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Jaen data is fetched by the publish worker, nobody waits for it
+FETCH_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+MAX_REDIRECTS = 3
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class JaenDataTooLarge(Exception):
+    pass
+
+
+class JaenDataRejected(Exception):
+    """The jaen data URL must not be fetched by the CMS."""
+
+
+def get_client() -> httpx.Client:
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(timeout=FETCH_TIMEOUT, trust_env=False)
+
+    return _client
+
+
+def check_url(url: str) -> None:
+    """Raise JaenDataRejected unless url is https on an allowed public host.
+
+    The fetched data is served publicly, so the CMS must never be used to
+    read internal services. Hosts are matched against
+    JAEN_DATA_ALLOWED_HOSTS like ALLOWED_HOSTS, every address the host
+    resolves to has to be a global one.
+    """
+    parts = urlsplit(url)
+
+    if parts.scheme != "https":
+        raise JaenDataRejected(f"{url} is not an https URL")
+
+    host = parts.hostname
+
+    if not host or not validate_host(
+        host, getattr(settings, "JAEN_DATA_ALLOWED_HOSTS", [])
+    ):
+        raise JaenDataRejected(f"{host} is not in JAEN_DATA_ALLOWED_HOSTS")
+
+    try:
+        addresses = socket.getaddrinfo(
+            host, parts.port or 443, proto=socket.IPPROTO_TCP
+        )
+    except (socket.gaierror, UnicodeError) as e:
+        raise JaenDataRejected(f"Could not resolve {host}: {e}")
+
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        address = getattr(address, "ipv4_mapped", None) or address
+
+        if not address.is_global or address.is_multicast:
+            raise JaenDataRejected(f"{host} resolves to {address}")
+
+
+def fetch_jaen_data(url: str) -> tuple:
+    """Download the jaen data at url, returns (sha256 hex digest, content).
+
+    Redirects are followed by hand so every target is checked again.
+    """
+    max_size = getattr(settings, "JAEN_DATA_MAX_SIZE", 20 * 1024 * 1024)
+
+    for _ in range(MAX_REDIRECTS + 1):
+        check_url(url)
+
+        with get_client().stream("GET", url, allow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["Location"])
+                continue
+
+            response.raise_for_status()
+
+            return read_limited(response, url, max_size)
+
+    raise JaenDataRejected(f"More than {MAX_REDIRECTS} redirects")
+
+
+def read_limited(response: httpx.Response, url: str, max_size: int) -> tuple:
+    if int(response.headers.get("Content-Length") or 0) > max_size:
+        raise JaenDataTooLarge(f"{url} is larger than {max_size} bytes")
+
+    hasher = hashlib.sha256()
+    chunks = []
+    size = 0
+
+    for chunk in response.iter_bytes():
+        size += len(chunk)
+
+        if size > max_size:
+            raise JaenDataTooLarge(f"{url} is larger than {max_size} bytes")
+
+        hasher.update(chunk)
+        chunks.append(chunk)
+
+    return hasher.hexdigest(), b"".join(chunks)
+
+
+def compress(content: bytes) -> tuple:
+    """Return the gzip and brotli encodings of content, brotli is optional."""
+    # mtime=0 keeps the output, and so the ETag of the variant, stable
+    content_gzip = gzip.compress(content, compresslevel=9, mtime=0)
+    content_br = brotli.compress(content) if brotli is not None else None
+
+    return content_gzip, content_br
+
+
+def store_snapshot(checksum: str, content: bytes) -> object:
+    """Store content under its checksum, once."""
+    from .models import JaenDataSnapshot
+
+    snapshot = JaenDataSnapshot.objects.filter(checksum=checksum).only("pk").first()
+
+    if snapshot is not None:
+        return snapshot
+
+    content_gzip, content_br = compress(content)
+
+    try:
+        with transaction.atomic():
+            return JaenDataSnapshot.objects.create(
+                checksum=checksum,
+                content=content,
+                content_gzip=content_gzip,
+                content_br=content_br,
+                size=len(content),
+            )
+    except IntegrityError:
+        # Stored by another worker in the meantime
+        return JaenDataSnapshot.objects.only("pk").get(checksum=checksum)
+
+
+def get_snapshot_url(checksum: str) -> str:
+    """Absolute URL of a snapshot, None without settings.BASE_URL."""
+    from django.urls import reverse
+
+    base_url = getattr(settings, "BASE_URL", None)
+
+    if not base_url:
+        return None
+
+    return base_url + reverse("jaen_data", args=[checksum])
+
+
+def last_published_checksum(git_remote: str, jaen_account: object) -> str:
+    from .models import JaenPublishJob
+
+    return (
+        JaenPublishJob.objects.filter(
+            git_remote=git_remote,
+            jaen_account=jaen_account,
+            status__in=[JaenPublishJob.DONE, JaenPublishJob.UNCHANGED],
+        )
+        .exclude(checksum="")
+        .order_by("-finished_at")
+        .values_list("checksum", flat=True)
+        .first()
+    )
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -1,4 +1,554 @@
-# Create your tests here.
+import gzip
+import hashlib
+import json
+import socket
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import github, snapshots
+from .github import (
+    CircuitBreaker,
+    GitHubUnavailable,
+    close_clients,
+    repository_dispatch,
+)
+from .models import JaenAccount, JaenDataSnapshot, JaenPublishJob
+from .publisher import PublishQueue, queue_publish
+from .snapshots import (
+    JaenDataRejected,
+    JaenDataTooLarge,
+    check_url,
+    fetch_jaen_data,
+    store_snapshot,
+)
+
+
+class GitHubHandler(BaseHTTPRequestHandler):
+    """Answer dispatches like api.github.com, requests go to server.requests."""
+
+    # Keep connections alive like GitHub does
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(
+            (self.client_address, self.path, self.headers, json.loads(body))
+        )
+
+        self.send_response(self.server.status)
+        for name, value in self.server.response_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class GitHubClientTest(SimpleTestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), GitHubHandler)
+        server.requests = []
+        server.status = 204
+        server.response_headers = {}
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+
+        settings = override_settings(
+            JAEN_GITHUB_API_URL=f"http://127.0.0.1:{server.server_port}"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        # The client is bound to the API URL it was created with
+        close_clients()
+        self.addCleanup(close_clients)
+
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+        patcher = mock.patch.object(github, "breaker", self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def dispatch(self, token="token-dispatch"):
+        return repository_dispatch("snek-at/site", token, "update-jaen-data", {})
+
+    def test_dispatch(self):
+        for url in [
+            "https://jaen.example.com/1.json",
+            "https://jaen.example.com/2.json",
+        ]:
+            response = repository_dispatch(
+                "snek-at/site",
+                "token-dispatch",
+                "update-jaen-data",
+                {"jaendata_url": url},
+            )
+            self.assertEqual(response.status_code, 204)
+
+        first, second = self.server.requests
+        address, path, headers, body = second
+
+        self.assertEqual(path, "/repos/snek-at/site/dispatches")
+        self.assertEqual(headers["Authorization"], "token token-dispatch")
+        self.assertEqual(
+            headers["Accept"], "application/vnd.github.everest-preview+json"
+        )
+        self.assertEqual(
+            body,
+            {
+                "event_type": "update-jaen-data",
+                "client_payload": {"jaendata_url": "https://jaen.example.com/2.json"},
+            },
+        )
+        # Both went over the same pooled connection
+        self.assertEqual(first[0], address)
+
+    def test_rate_limit(self):
+        self.server.response_headers = {
+            "X-RateLimit-Remaining": "3",
+            "X-RateLimit-Reset": str(int(time.time()) + 60),
+        }
+
+        self.dispatch()
+
+        with self.assertRaises(GitHubUnavailable) as cm:
+            self.dispatch()
+
+        self.assertGreater(cm.exception.retry_after, 0)
+        self.assertEqual(len(self.server.requests), 1)
+
+        # Other tokens have their own limit
+        self.dispatch(token="token-other")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_circuit_breaker(self):
+        self.server.status = 502
+
+        for _ in range(2):
+            self.assertEqual(self.dispatch().status_code, 502)
+
+        with self.assertRaises(GitHubUnavailable):
+            self.dispatch()
+
+        self.assertTrue(self.breaker.is_open)
+        self.assertEqual(len(self.server.requests), 2)
+
+        # After reset_timeout one trial call closes the circuit again
+        self.breaker._opened_at -= self.breaker.reset_timeout
+        self.server.status = 204
+
+        self.assertEqual(self.dispatch().status_code, 204)
+        self.assertFalse(self.breaker.is_open)
+        self.assertEqual(len(self.server.requests), 3)
+
+
+@override_settings(JAEN_PUBLISH_DEBOUNCE=10, JAEN_PUBLISH_MAX_DELAY=60)
+class PublishQueueTest(TestCase):
+    remote = "snek-at/site"
+
+    def setUp(self):
+        self.account = self.create_account("snek-11700000")
+
+    @staticmethod
+    def create_account(username):
+        user = get_user_model().objects.create_user(username)
+
+        return JaenAccount.objects.create(user=user, git_token="token")
+
+    def queue(self, jaendata_url, account=None, remote=None):
+        return queue_publish(
+            None, account or self.account, remote or self.remote, jaendata_url
+        )
+
+    def make_due(self, **filters):
+        JaenPublishJob.objects.filter(**filters).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_coalesce(self):
+        first = self.queue("https://jaen.example.com/1.json")
+        second = self.queue("https://jaen.example.com/2.json")
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(JaenPublishJob.objects.count(), 1)
+
+        job = JaenPublishJob.objects.get()
+        self.assertEqual(job.jaendata_url, "https://jaen.example.com/2.json")
+        self.assertGreater(job.next_attempt_at, timezone.now() + timedelta(seconds=5))
+
+    def test_coalesce_per_account_and_remote(self):
+        other = self.create_account("snek-11700001")
+
+        jobs = {
+            self.queue("https://jaen.example.com/1.json").pk,
+            self.queue("https://jaen.example.com/1.json", remote="snek-at/docs").pk,
+            self.queue("https://jaen.example.com/1.json", account=other).pk,
+        }
+
+        self.assertEqual(len(jobs), 3)
+        accounts = JaenPublishJob.objects.filter(pk__in=jobs).values_list(
+            "jaen_account", flat=True
+        )
+        self.assertEqual(set(accounts), {self.account.pk, other.pk})
+
+    def test_max_delay(self):
+        job = self.queue("https://jaen.example.com/1.json")
+        created_at = timezone.now() - timedelta(seconds=55)
+        JaenPublishJob.objects.filter(pk=job.pk).update(
+            created_at=created_at, next_attempt_at=created_at + timedelta(seconds=10)
+        )
+
+        job = self.queue("https://jaen.example.com/2.json")
+
+        self.assertEqual(job.next_attempt_at, created_at + timedelta(seconds=60))
+
+    def test_coalesce_after_failure(self):
+        job = self.queue("https://jaen.example.com/1.json")
+        backoff = timezone.now() + timedelta(seconds=120)
+        JaenPublishJob.objects.filter(pk=job.pk).update(
+            created_at=timezone.now() - timedelta(seconds=300),
+            attempts=1,
+            last_error="HTTPStatusError('502 Bad Gateway')",
+            next_attempt_at=backoff,
+        )
+
+        # Pressing publish again does not skip the backoff
+        job = self.queue("https://jaen.example.com/1.json")
+        self.assertEqual(job.next_attempt_at, backoff)
+        self.assertEqual(job.attempts, 1)
+
+        # New data gets its own attempts
+        job = self.queue("https://jaen.example.com/2.json")
+        self.assertEqual(job.next_attempt_at, backoff)
+        self.assertEqual(job.attempts, 0)
+        self.assertEqual(job.last_error, "")
+
+    def test_debounce_after_failure(self):
+        job = self.queue("https://jaen.example.com/1.json")
+        JaenPublishJob.objects.filter(pk=job.pk).update(
+            created_at=timezone.now() - timedelta(seconds=300), attempts=1
+        )
+        self.make_due()
+
+        job = self.queue("https://jaen.example.com/2.json")
+
+        self.assertGreater(job.next_attempt_at, timezone.now() + timedelta(seconds=5))
+
+    def test_running_with_same_data(self):
+        running = self.queue("https://jaen.example.com/1.json")
+        JaenPublishJob.objects.filter(pk=running.pk).update(
+            status=JaenPublishJob.RUNNING
+        )
+
+        self.assertEqual(self.queue("https://jaen.example.com/1.json").pk, running.pk)
+        self.assertNotEqual(
+            self.queue("https://jaen.example.com/2.json").pk, running.pk
+        )
+
+    def test_claim(self):
+        queue = PublishQueue()
+        job = self.queue("https://jaen.example.com/1.json")
+        other = self.queue("https://jaen.example.com/1.json", remote="snek-at/docs")
+
+        self.assertEqual(queue.claim(4), [])
+
+        self.make_due()
+        claimed = queue.claim(4)
+
+        self.assertEqual({c.pk for c in claimed}, {job.pk, other.pk})
+        job.refresh_from_db()
+        self.assertEqual(job.status, JaenPublishJob.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(
+            job.next_attempt_at, timezone.now() + timedelta(seconds=queue.lease - 5)
+        )
+
+    def test_claim_one_per_account_and_remote(self):
+        queue = PublishQueue()
+        self.queue("https://jaen.example.com/1.json")
+        self.make_due()
+        self.assertEqual(len(queue.claim(4)), 1)
+
+        # Waits until the running dispatch of the same remote is done
+        self.queue("https://jaen.example.com/2.json")
+        self.make_due(status=JaenPublishJob.PENDING)
+        self.assertEqual(queue.claim(4), [])
+
+        # The lease of the running job expired, only one of both is claimed
+        self.make_due()
+        self.assertEqual(len(queue.claim(4)), 1)
+
+
+def resolve_to(*addresses):
+    """Let every host name resolve to addresses."""
+    return mock.patch(
+        "socket.getaddrinfo",
+        return_value=[
+            (
+                socket.AF_INET6 if ":" in address else socket.AF_INET,
+                1,
+                6,
+                "",
+                (address, 443),
+            )
+            for address in addresses
+        ],
+    )
+
+
+@override_settings(JAEN_DATA_ALLOWED_HOSTS=["jaen.example.com", ".ipfs.io"])
+class CheckUrlTest(SimpleTestCase):
+    def test_allowed(self):
+        with resolve_to("93.184.216.34", "2606:2800:220:1:248:1893:25c8:1946"):
+            check_url("https://jaen.example.com/data.json")
+            check_url("https://bafybeig.ipfs.io/data.json")
+
+    def test_scheme(self):
+        for url in ["http://jaen.example.com/data.json", "file:///etc/passwd"]:
+            with self.subTest(url=url), resolve_to("93.184.216.34"):
+                with self.assertRaises(JaenDataRejected):
+                    check_url(url)
+
+    def test_host_not_allowed(self):
+        for url in [
+            "https://evil.example.com/data.json",
+            "https://jaen.example.com.evil.com/data.json",
+            "https://93.184.216.34/data.json",
+        ]:
+            with self.subTest(url=url), resolve_to("93.184.216.34"):
+                with self.assertRaises(JaenDataRejected):
+                    check_url(url)
+
+    def test_internal_addresses(self):
+        for addresses in [
+            ["127.0.0.1"],
+            ["10.0.0.5"],
+            ["169.254.169.254"],
+            ["224.0.0.1"],
+            ["::1"],
+            ["fd00::1"],
+            ["::ffff:10.0.0.5"],
+            # One internal address is enough
+            ["93.184.216.34", "192.168.1.1"],
+        ]:
+            with self.subTest(addresses=addresses), resolve_to(*addresses):
+                with self.assertRaises(JaenDataRejected):
+                    check_url("https://jaen.example.com/data.json")
+
+    def test_unresolvable(self):
+        with mock.patch("socket.getaddrinfo", side_effect=socket.gaierror(-2)):
+            with self.assertRaises(JaenDataRejected):
+                check_url("https://jaen.example.com/data.json")
+
+
+@override_settings(JAEN_DATA_ALLOWED_HOSTS=["jaen.example.com"])
+class FetchJaenDataTest(SimpleTestCase):
+    url = "https://jaen.example.com/data.json"
+    content = json.dumps({"pages": {}}).encode()
+
+    def setUp(self):
+        # {url: response}, every requested URL goes to self.requested
+        self.routes = {}
+        self.requested = []
+
+        client = httpx.Client(transport=httpx.MockTransport(self.handle))
+        self.addCleanup(client.close)
+
+        for patcher in [
+            mock.patch.object(snapshots, "_client", client),
+            resolve_to("93.184.216.34"),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def handle(self, request):
+        self.requested.append(str(request.url))
+
+        return self.routes[str(request.url)]
+
+    def redirect(self, location):
+        return httpx.Response(302, headers={"Location": location})
+
+    def test_fetch(self):
+        self.routes[self.url] = httpx.Response(200, content=self.content)
+
+        self.assertEqual(
+            fetch_jaen_data(self.url),
+            (hashlib.sha256(self.content).hexdigest(), self.content),
+        )
+
+    def test_redirect(self):
+        self.routes["https://jaen.example.com/latest"] = self.redirect("/data.json")
+        self.routes[self.url] = httpx.Response(200, content=self.content)
+
+        _, content = fetch_jaen_data("https://jaen.example.com/latest")
+
+        self.assertEqual(content, self.content)
+
+    def test_redirect_to_internal_host(self):
+        self.routes[self.url] = self.redirect("http://169.254.169.254/latest/")
+
+        with self.assertRaises(JaenDataRejected):
+            fetch_jaen_data(self.url)
+
+        self.assertEqual(self.requested, [self.url])
+
+    def test_too_many_redirects(self):
+        self.routes[self.url] = self.redirect(self.url)
+
+        with self.assertRaises(JaenDataRejected):
+            fetch_jaen_data(self.url)
+
+        self.assertEqual(len(self.requested), snapshots.MAX_REDIRECTS + 1)
+
+    @override_settings(JAEN_DATA_MAX_SIZE=8)
+    def test_too_large(self):
+        for response in [
+            httpx.Response(200, content=self.content),
+            # Without Content-Length
+            httpx.Response(200, content=iter([self.content])),
+        ]:
+            self.routes[self.url] = response
+
+            with self.subTest(headers=response.headers):
+                with self.assertRaises(JaenDataTooLarge):
+                    fetch_jaen_data(self.url)
+
+    def test_error(self):
+        self.routes[self.url] = httpx.Response(404)
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            fetch_jaen_data(self.url)
+
+
+class PublishTest(TestCase):
+    remote = "snek-at/site"
+    content = json.dumps({"pages": {}}).encode()
+
+    def setUp(self):
+        user = get_user_model().objects.create_user("snek-11700000")
+        self.account = JaenAccount.objects.create(user=user, git_token="token")
+
+        JaenPublishJob.objects.create(
+            jaen_account=self.account,
+            git_remote=self.remote,
+            jaendata_url="https://jaen.example.com/1.json",
+            checksum=hashlib.sha256(self.content).hexdigest(),
+            status=JaenPublishJob.DONE,
+            finished_at=timezone.now() - timedelta(hours=1),
+        )
+
+        self.job = JaenPublishJob.objects.create(
+            jaen_account=self.account,
+            git_remote=self.remote,
+            jaendata_url="https://jaen.example.com/2.json",
+            status=JaenPublishJob.RUNNING,
+            attempts=1,
+        )
+
+        patcher = mock.patch("esite.jaen_cms.publisher.dispatch_jaen_data")
+        self.dispatch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def publish(self, fetched):
+        with mock.patch("esite.jaen_cms.publisher.fetch_jaen_data", **fetched):
+            PublishQueue().publish(self.job)
+
+        self.job.refresh_from_db()
+
+    def test_unchanged(self):
+        checksum = hashlib.sha256(self.content).hexdigest()
+
+        self.publish({"return_value": (checksum, self.content)})
+
+        self.assertEqual(self.job.status, JaenPublishJob.UNCHANGED)
+        self.assertEqual(self.job.checksum, checksum)
+        self.dispatch.assert_not_called()
+
+    def test_changed(self):
+        content = json.dumps({"pages": {"index": {}}}).encode()
+        checksum = hashlib.sha256(content).hexdigest()
+
+        self.publish({"return_value": (checksum, content)})
+
+        self.assertEqual(self.job.status, JaenPublishJob.DONE)
+        self.dispatch.assert_called_once_with(
+            self.account, self.remote, "https://jaen.example.com/2.json", checksum
+        )
+        self.assertTrue(JaenDataSnapshot.objects.filter(checksum=checksum).exists())
+
+    def test_fetch_rejected(self):
+        self.publish({"side_effect": JaenDataRejected("Not allowed")})
+
+        # Dispatched without the unchanged check
+        self.assertEqual(self.job.status, JaenPublishJob.DONE)
+        self.assertEqual(self.job.checksum, "")
+        self.dispatch.assert_called_once()
+
+
+class JaenDataViewTest(TestCase):
+    content = json.dumps({"pages": {"index": {"title": "snek"}}}).encode() * 20
+
+    def setUp(self):
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+        store_snapshot(self.checksum, self.content)
+        self.url = reverse("jaen_data", args=[self.checksum])
+
+    def test_identity(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.content)
+        self.assertEqual(response["ETag"], f'"{self.checksum}"')
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], f'"{self.checksum}-gzip"')
+        self.assertEqual(gzip.decompress(response.content), self.content)
+
+    def test_refused_encoding(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.content)
+
+    def test_not_modified(self):
+        for etag in [f'"{self.checksum}"', f'"{self.checksum}-gzip"']:
+            for if_none_match in [etag, f'"other", W/{etag}']:
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=if_none_match)
+
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+                self.assertEqual(response.content, b"")
+
+    def test_modified(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown(self):
+        url = reverse("jaen_data", args=["0" * 64])
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=f'"{"0" * 64}"').status_code, 404
+        )
+
 
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
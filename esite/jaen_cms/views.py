@@ -1,4 +1,148 @@
 # Create your views here.
+from django.contrib.auth import authenticate
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+from graphql_jwt.exceptions import JSONWebTokenError
+
+from .models import JaenDataSnapshot, JaenPublishJob
+
+# Snapshots never change, their URL contains the checksum
+SNAPSHOT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Preferred first
+SNAPSHOT_ENCODINGS = [("br", "content_br"), ("gzip", "content_gzip")]
+
+
+def get_request_user(request):
+    """The session user, or the user of a JWT sent as to the GraphQL API."""
+    if request.user.is_authenticated:
+        return request.user
+
+    try:
+        return authenticate(request=request)
+    except JSONWebTokenError:
+        return None
+
+
+def publish_job(request, job_id):
+    """Poll a queued publish, answers 202 until the worker has finished it.
+
+    Only the owner of the job can see it, like `jaenPublishJob` in the API.
+    """
+    user = get_request_user(request)
+
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    job = get_object_or_404(JaenPublishJob, pk=job_id, jaen_account__user=user)
+
+    response = JsonResponse(
+        {
+            "id": str(job.pk),
+            "status": job.status,
+            "attempts": job.attempts,
+            "checksum": job.checksum,
+            "error": job.last_error if job.status == JaenPublishJob.FAILED else "",
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        },
+        status=200 if job.is_finished else 202,
+    )
+
+    if not job.is_finished:
+        response["Retry-After"] = "1"
+
+    patch_vary_headers(response, ["Authorization", "Cookie"])
+
+    return response
+
+
+def accepted_encodings(request):
+    encodings = set()
+
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        encoding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+
+        for param in params:
+            name, _, value = param.partition("=")
+
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if encoding and quality > 0:
+            encodings.add(encoding.lower())
+
+    return encodings
+
+
+@require_safe
+def jaen_data(request, checksum):
+    """Serve a stored jaen data snapshot.
+
+    Every encoding gets its own strong ETag. As the content of a checksum
+    never changes, a client holding any of them gets a 304.
+    """
+    etags = {
+        f'"{checksum}"',
+        *(f'"{checksum}-{encoding}"' for encoding, _ in SNAPSHOT_ENCODINGS),
+    }
+    snapshots = JaenDataSnapshot.objects.filter(checksum=checksum)
+
+    # Proxies that compress on their own turn our ETags into weak ones
+    if_none_match = [
+        etag.strip().replace("W/", "", 1)
+        for etag in request.META.get("HTTP_IF_NONE_MATCH", "").split(",")
+    ]
+    matched = next((etag for etag in if_none_match if etag in etags), None)
+
+    if matched is not None:
+        if not snapshots.exists():
+            raise Http404
+
+        response = HttpResponseNotModified()
+        response["ETag"] = matched
+    else:
+        response = snapshot_response(request, snapshots, checksum)
+
+    response["Cache-Control"] = SNAPSHOT_CACHE_CONTROL
+    patch_vary_headers(response, ["Accept-Encoding"])
+
+    return response
+
+
+def snapshot_response(request, snapshots, checksum):
+    accepted = accepted_encodings(request)
+    candidates = [item for item in SNAPSHOT_ENCODINGS if item[0] in accepted]
+
+    # Only load the variants the client can use
+    if candidates:
+        row = snapshots.values_list(*(field for _, field in candidates)).first()
+
+        if row is None:
+            raise Http404
+
+        for (encoding, _), content in zip(candidates, row):
+            if content is not None:
+                response = HttpResponse(bytes(content), content_type="application/json")
+                response["Content-Encoding"] = encoding
+                response["ETag"] = f'"{checksum}-{encoding}"'
+                return response
+
+    content = snapshots.values_list("content", flat=True).first()
+
+    if content is None:
+        raise Http404
+
+    response = HttpResponse(bytes(content), content_type="application/json")
+    response["ETag"] = f'"{checksum}"'
+
+    return response
+
 
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
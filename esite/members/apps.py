@@ -1,13 +1,12 @@
-import hashlib
-
-from django.apps import AppConfig
-from django.db.models.signals import post_migrate
 from django.apps import AppConfig
 
 
 # This defines the name of the app.
 class MembersConfig(AppConfig):
-    name = "members"
+    name = "esite.members"
+
+    def ready(self):
+        from . import signals  # noqa
 
 
 # SPDX-License-Identifier: (EUPL-1.2)
@@ -0,0 +1,17 @@
+from esite.core.cache import IdSetCache
+
+
+def member_telegram_user_ids() -> object:
+    from .models import Member
+
+    return Member.objects.values_list("telegram_user_id", flat=True)
+
+
+# Telegram user ids of all members, kept warm by the signals of Member
+known_member_ids = IdSetCache(
+    member_telegram_user_ids, "MEMBER_ID_CACHE_REFRESH_INTERVAL"
+)
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,67 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def resolve_duplicate_telegram_user_ids(apps, schema_editor):
+    """Keep one member per Telegram user, the activated or else the newest.
+
+    Registrations of the other members that were never activated are
+    deleted with their inactive user, so the matrikelnummer can be used
+    again. Other activated members keep their user but lose the Telegram
+    link, a negative id never matches a Telegram user.
+    """
+    Member = apps.get_model("members", "Member")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+    duplicates = (
+        Member.objects.values("telegram_user_id")
+        .annotate(count=Count("pk"))
+        .filter(count__gt=1)
+        .values_list("telegram_user_id", flat=True)
+    )
+
+    for telegram_user_id in list(duplicates):
+        _, *others = Member.objects.filter(telegram_user_id=telegram_user_id).order_by(
+            "-is_member", "-pk"
+        )
+
+        for member in others:
+            if member.is_member:
+                member.telegram_user_id = -member.pk
+                member.save(update_fields=["telegram_user_id"])
+            elif User.objects.filter(pk=member.user_id, is_active=False).exists():
+                # Deletes the member with it
+                User.objects.filter(pk=member.user_id).delete()
+            else:
+                member.delete()
+
+
+class Migration(migrations.Migration):
+
+    # Commit the data changes before altering the table, PostgreSQL refuses
+    # to alter a table with pending deferred constraint checks
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("members", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            resolve_duplicate_telegram_user_ids, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name="member",
+            name="telegram_user_id",
+            field=models.BigIntegerField(
+                error_messages={"unique": "A user with that user_id already exists."},
+                help_text="Required. 64 Bit Integer. Digits only.",
+                unique=True,
+                verbose_name="user id",
+            ),
+        ),
+    ]
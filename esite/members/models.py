@@ -43,8 +43,9 @@ class Member(ClusterableModel):
         validators=[UnicodeUsernameValidator],
     )
 
-    telegram_user_id = models.IntegerField(
+    telegram_user_id = models.BigIntegerField(
         "user id",
+        unique=True,
         error_messages={"unique": "A user with that user_id already exists."},
         help_text="Required. 64 Bit Integer. Digits only.",
     )
@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .cache import known_member_ids
+from .models import Member
+
+
+@receiver(post_init, sender=Member)
+def track_member_id(sender, instance, **kwargs):
+    # None if the field was deferred, the old id is unknown then
+    instance._saved_telegram_user_id = instance.__dict__.get("telegram_user_id")
+
+
+@receiver(post_save, sender=Member)
+def remember_member_id(sender, instance, **kwargs):
+    old_id = instance._saved_telegram_user_id
+    new_id = instance._saved_telegram_user_id = instance.telegram_user_id
+
+    def update():
+        if old_id is not None and old_id != new_id:
+            known_member_ids.discard(old_id)
+
+        known_member_ids.add(new_id)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Member)
+def forget_member_id(sender, instance, **kwargs):
+    transaction.on_commit(lambda: known_member_ids.discard(instance.telegram_user_id))
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
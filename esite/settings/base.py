@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     "esite.user",
     "esite.documents",
     "esite.images",
+    "esite.members",
     "esite.sneklog_bot",
     "esite.jaen_cms",
     # Django core apps
@@ -323,5 +324,12 @@ CHANNEL_LAYERS = {
 # Private file storage
 PRIVATE_STORAGE_ROOT = "private_media/"
 
+# > Jaen CMS
+# Hosts the publish worker may fetch jaen data from, matched like
+# ALLOWED_HOSTS. Jaen publishes its data to IPFS.
+JAEN_DATA_ALLOWED_HOSTS = env.get(
+    "JAEN_DATA_ALLOWED_HOSTS", "ipfs.io;.ipfs.io;ipfs.infura.io"
+).split(";")
+
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
@@ -289,5 +289,10 @@ TELEGRAM_API_ID = os.getenv("TELEGRAM_API_ID", "")
 TELEGRAM_API_HASH = os.getenv("TELEGRAM_API_HASH", "")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 
+# > Metrics
+# Prometheus scrapes /metrics/ with this bearer token, unset disables it.
+if "METRICS_TOKEN" in env:
+    METRICS_TOKEN = env["METRICS_TOKEN"]
+
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
@@ -5,7 +5,36 @@ from wagtail.contrib.modeladmin.options import (
     modeladmin_register,
 )
 
-# Register your models here.
+from .models import Broadcast, TelegramChatGroup
+
+
+class BroadcastAdmin(ModelAdmin):
+    model = Broadcast
+    menu_label = "Broadcasts"
+    menu_icon = "mail"
+    menu_order = 300
+    add_to_settings_menu = False
+    exclude_from_explorer = False
+
+    list_display = ("created_at", "audience", "status", "sent", "failed", "message")
+    list_filter = ("status", "audience")
+    search_fields = ("message",)
+
+
+class TelegramChatGroupAdmin(ModelAdmin):
+    model = TelegramChatGroup
+    menu_label = "Managed Groups"
+    menu_icon = "group"
+    menu_order = 310
+    add_to_settings_menu = False
+    exclude_from_explorer = False
+
+    list_display = ("name", "chat_id", "registered_at")
+    search_fields = ("name", "chat_id")
+
+
+modeladmin_register(BroadcastAdmin)
+modeladmin_register(TelegramChatGroupAdmin)
 
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Chats all communication with the snek bot is logged to
+AUDIT_LOG_CHAT = -1001464884999
+ERROR_LOG_CHAT = -1001175848537
+
+
+class AuditForwarder:
+    """Forward logged messages in batches instead of one request per message.
+
+    Message ids are queued per target and source chat and sent with a single
+    `forward_messages` call once `batch_size` ids are pending or
+    `flush_interval` seconds have passed. The queue is bounded, when it is
+    full new messages are dropped and counted instead of slowing down the
+    handlers.
+    """
+
+    # fields
+    # Telegram accepts at most 100 message ids per forward request
+    max_batch_size: int = 100
+
+    # ctor
+    def __init__(
+        self,
+        scheduler: object,
+        max_queue_size: int = 1000,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+    ) -> None:
+        self.scheduler = scheduler
+        self.batch_size = min(batch_size, self.max_batch_size)
+        self.flush_interval = flush_interval
+        self.dropped = 0
+
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._pending = {}
+        self._pending_count = 0
+        self._dropped_unreported = 0
+
+    # props
+    @property
+    def depth(self) -> int:
+        """Number of messages waiting to be forwarded."""
+        return self._queue.qsize() + self._pending_count
+
+    # meths
+    def submit(self, target: int, chat_id: int, message_id: int) -> bool:
+        """Queue a message for forwarding, never blocks the caller."""
+        try:
+            self._queue.put_nowait((target, chat_id, message_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._dropped_unreported += 1
+            return False
+
+        return True
+
+    def log(self, message: object, target: int = AUDIT_LOG_CHAT) -> bool:
+        return self.submit(target, message.chat_id, message.id)
+
+    async def run(self) -> None:
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+
+            try:
+                target, chat_id, message_id = await asyncio.wait_for(
+                    self._queue.get(), timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                await self.flush()
+                deadline = None
+                continue
+
+            self._pending.setdefault((target, chat_id), []).append(message_id)
+            self._pending_count += 1
+
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+
+            if self._pending_count >= self.batch_size:
+                await self.flush()
+                deadline = None
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._pending_count = 0
+
+        for (target, chat_id), message_ids in pending.items():
+            for i in range(0, len(message_ids), self.max_batch_size):
+                await self._forward(
+                    target, chat_id, message_ids[i : i + self.max_batch_size]
+                )
+
+        if self._dropped_unreported:
+            logger.warning(
+                "Audit log queue full, dropped %s messages (%s in total)",
+                self._dropped_unreported,
+                self.dropped,
+            )
+            self._dropped_unreported = 0
+
+    async def _forward(self, target: int, chat_id: int, message_ids: list) -> None:
+        try:
+            # The scheduler waits out FloodWaits and retries for us
+            await self.scheduler.forward_messages(
+                target, message_ids, from_peer=chat_id
+            )
+        except Exception as e:
+            logger.error(
+                "Could not forward %s messages to %s: %r", len(message_ids), target, e
+            )
+
+    async def stop(self) -> None:
+        """Forward everything that is still queued."""
+        while not self._queue.empty():
+            target, chat_id, message_id = self._queue.get_nowait()
+            self._pending.setdefault((target, chat_id), []).append(message_id)
+            self._pending_count += 1
+
+        await self.flush()
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,344 @@
+import asyncio
+import logging
+import signal
+
+from django.conf import settings
+from telethon import TelegramClient, events
+
+from .audit import AUDIT_LOG_CHAT, ERROR_LOG_CHAT, AuditForwarder
+from .broadcast import BroadcastRunner
+from .club_management import SnekManagement
+from .db_management import AsyncDBIO, run_in_db_pool
+from .ingest import FileIngest
+from .join_batcher import JoinBatcher
+from .membership import MembershipTracker
+from .metrics import (
+    QUEUE_DEPTH,
+    RATE_LIMITED,
+    instrument_handler,
+    record_registration,
+    sample_loop_lag,
+)
+from .ratelimit import get_rate_limiter
+from .scheduler import OutboundScheduler
+from .session import DatabaseSession
+
+logger = logging.getLogger(__name__)
+
+
+class SnekBot:
+    """The sneklog bot handlers.
+
+    The handlers are bound to the client passed in, a connected
+    TelegramClient in production or a FakeClient for offline load tests.
+    """
+
+    # fields
+    # Seconds between checks that this process still is the leader
+    leader_check_interval: float = 30.0
+
+    # ctor
+    def __init__(self, client: object) -> None:
+        self.client = client
+        # All outgoing requests go through the scheduler
+        self.scheduler = OutboundScheduler(
+            client, **getattr(settings, "SNEKLOG_BOT_OUTBOUND_LIMITS", {})
+        )
+        self.audit_log = AuditForwarder(self.scheduler)
+        self.rate_limiter = get_rate_limiter()
+        self.join_batcher = JoinBatcher(self.scheduler)
+        self.file_ingest = FileIngest(client, self.scheduler)
+        self.broadcasts = BroadcastRunner(self.scheduler)
+        self.memberships = MembershipTracker(client)
+        self._tasks = []
+        self._scheduler_task = None
+        self._leader_task = None
+        self._stopping = False
+        self._database_workers = False
+        # Set when the bot was stopped by a signal and must not restart
+        self.interrupted = False
+
+        QUEUE_DEPTH.labels(queue="audit").set_function(lambda: self.audit_log.depth)
+        QUEUE_DEPTH.labels(queue="joins").set_function(lambda: self.join_batcher.depth)
+        QUEUE_DEPTH.labels(queue="memberships").set_function(
+            lambda: self.memberships.depth
+        )
+
+    # meths
+    def register_handlers(self) -> None:
+        def add(callback, event):
+            self.client.add_event_handler(instrument_handler(callback), event)
+
+        # Handlers run in the order they are added
+        add(
+            self.rate_limit,
+            events.NewMessage(incoming=True, func=self.is_rate_limited),
+        )
+        add(self.start, events.NewMessage(pattern="/help"))
+        add(self.start, events.NewMessage(pattern="/start"))
+        add(self.register, events.NewMessage(pattern="/register"))
+        add(
+            self.ingest_handler,
+            events.NewMessage(
+                incoming=True,
+                func=lambda e: e.is_private and FileIngest.is_ingestable(e.message),
+            ),
+        )
+        add(self.registration_handler, events.NewMessage())
+        add(self.join_handler, events.ChatAction())
+
+    def start_background_tasks(self, database_workers: bool = True) -> None:
+        """Start the outbound queues.
+
+        Without database_workers the broadcast and membership workers, which
+        write what the client reports to the database, are not started, e.g.
+        for offline benchmarks with a FakeClient.
+        """
+        loop = asyncio.get_event_loop()
+
+        self._scheduler_task = loop.create_task(self.scheduler.run())
+        self._tasks = [
+            loop.create_task(self.audit_log.run()),
+            loop.create_task(self.join_batcher.run()),
+            loop.create_task(sample_loop_lag()),
+        ]
+
+        if database_workers:
+            self._tasks += [
+                loop.create_task(self.broadcasts.run()),
+                loop.create_task(self.memberships.run()),
+                loop.create_task(self.memberships.run_sweeps()),
+            ]
+
+        self._database_workers = database_workers
+
+    def watch_leader(self, leader: object) -> None:
+        """Stop the bot as soon as leader does not hold its lock anymore."""
+        self._leader_task = asyncio.get_event_loop().create_task(
+            self._watch_leader(leader)
+        )
+
+    async def _watch_leader(self, leader: object) -> None:
+        loop = asyncio.get_event_loop()
+
+        while True:
+            await asyncio.sleep(self.leader_check_interval)
+
+            if not await loop.run_in_executor(None, leader.check):
+                logger.error("Lost the leader lock, stopping the bot")
+                await self.stop()
+                return
+
+    async def shutdown(self) -> None:
+        """Cancel the background tasks and flush what is still queued."""
+        for task in self._tasks:
+            task.cancel()
+
+        # The scheduler still runs, forwarding needs a connected client
+        if self.client.is_connected():
+            await self.audit_log.stop()
+
+        if self._database_workers:
+            try:
+                await self.memberships.flush()
+            except Exception as e:
+                logger.error("Could not update memberships: %r", e)
+
+        if self._scheduler_task is not None:
+            self._scheduler_task.cancel()
+
+    async def stop(self, interrupted: bool = False) -> None:
+        """Shut down while the client is connected, then disconnect it."""
+        self.interrupted = self.interrupted or interrupted
+
+        if self._stopping:
+            return
+
+        self._stopping = True
+
+        try:
+            await self.shutdown()
+        finally:
+            await self.client.disconnect()
+
+    @staticmethod
+    def is_rate_limited(event: object) -> bool:
+        """Only private chats and commands are answered by the bot."""
+        return event.is_private or (event.message.message or "").startswith("/")
+
+    async def rate_limit(self, event: object) -> None:
+        """Drop flooding senders before any other handler runs."""
+        if not await self.rate_limiter.allow(event.sender_id):
+            RATE_LIMITED.inc()
+            raise events.StopPropagation
+
+    async def start(self, event: object) -> None:
+        """Send a message when the command /start is issued."""
+        await self.scheduler.respond(
+            event,
+            """**Willkommen bei TUWien.snek**\n\nUm unseren Studierendengruppen beitreten zu können, musst du dich vorab mit deiner Matrikelnummer identifizieren.
+            \nDazu musst du mir deine Matrikelnummer (z.B.: `11700000`) senden. Anschließend bekommst du einen Aktivierungslink per Mail an deine Studierendenmailadresse gesendet.
+            \n\nBei Problemen melde dich bitte bei @vileslide""",
+        )
+        raise events.StopPropagation
+
+    async def is_admin(self, user_id: int) -> bool:
+        from esite.core.snapshot import get_snek_settings
+
+        return await run_in_db_pool(lambda: get_snek_settings().is_admin(user_id))
+
+    async def register(self, event: object) -> None:
+        """Record the group /register is sent in as managed, admins only."""
+        if not await self.is_admin(event.sender_id):
+            raise events.StopPropagation
+
+        if event.is_private:
+            await self.scheduler.reply(
+                event, "Bitte sende /register in der Gruppe, die verwaltet werden soll."
+            )
+            raise events.StopPropagation
+
+        chat = await event.get_chat()
+
+        if await AsyncDBIO.register_chat(event.chat_id, getattr(chat, "title", None)):
+            await self.scheduler.reply(event, "Die Gruppe wurde registriert.")
+            await self.scheduler.send_message(
+                677357231,
+                f"de neie registrierte gruppn {event.chat_id}",
+                priority=self.scheduler.AUDIT,
+            )
+        else:
+            await self.scheduler.reply(event, "Die Gruppe ist bereits registriert.")
+
+        raise events.StopPropagation
+
+    async def ingest_handler(self, event: object) -> None:
+        """Store documents and photos sent by admins in Wagtail."""
+        if not await self.is_admin(event.sender_id):
+            # Everybody else gets the usual registration answer
+            return
+
+        self.audit_log.log(event.message, AUDIT_LOG_CHAT)
+
+        try:
+            obj = await self.file_ingest.ingest(event)
+        except Exception as e:
+            logger.error("Could not store file from %s: %r", event.sender_id, e)
+            await self.scheduler.reply(event, f"Upload failed: {e}")
+        else:
+            await self.scheduler.reply(
+                event, f"Stored as {obj._meta.verbose_name} {obj.pk}."
+            )
+
+        raise events.StopPropagation
+
+    async def registration_handler(self, event: object) -> None:
+        # Log all communication with the snek bot
+        self.audit_log.log(event.message, AUDIT_LOG_CHAT)
+
+        try:
+            if event.message.text.isnumeric():
+                if await SnekManagement.register_user(
+                    matrikelnummer=event.message.text,
+                    telegram_user=await event.get_sender(),
+                ):
+                    await self.scheduler.reply(
+                        event,
+                        f"**Vielen Dank!**\n\nEin Aktivierungslink wurde an deine Studierendenmailadresse gesendet."
+                        + "Sobald der Link bestätigt wurde, kannst du allen Gruppen uneingeschränkt beitreten. Bitte halte dich an die Regeln (www.tuwien.snek/rules).",
+                    )
+                else:
+                    raise Exception(
+                        "Die angegebene Matrikelnummer wird bereits verwendet oder ist keine gültige Matrikelnummer. (Wenn dieser Fehler trotz richtiger Matrikelnummer auftritt, melde dich bitte bei @vileslide und wir schalten dich frei)"
+                    )
+            else:
+                record_registration(False, "not_numeric")
+                raise Exception(
+                    "Deine Eingabe konnte leider nicht erkannt werden. Um dich zu registrieren, sende mir bitte deine Matrikelnummer."
+                )
+
+        except Exception as e:
+            await self.scheduler.reply(
+                event,
+                # f"Shit happens! Something has gone wrong.\n\n**Error:** {e}"
+                f"{e}",
+            )
+            # Log all communication with the snek bot
+            self.audit_log.log(event.message, ERROR_LOG_CHAT)
+
+    async def join_handler(self, event: object) -> None:
+        joined = event.user_joined or event.user_added
+        left = event.user_left or event.user_kicked
+
+        if not (joined or left):
+            return
+
+        # Only groups registered with /register are moderated
+        if not await AsyncDBIO.is_managed_chat(event.chat_id):
+            return
+
+        if left:
+            self.memberships.left(event.chat_id, event.user_ids)
+            return
+
+        self.memberships.joined(event.chat_id, event.user_ids)
+        # Check every new user, joins are checked and cleaned up in batches
+        self.join_batcher.submit(event)
+        # await event.reply('Welcome to the group!')
+
+    @classmethod
+    def main(cls, leader: object = None) -> "SnekBot":
+        """Run the bot until it is disconnected or stopped by a signal.
+
+        With a LeaderLock the bot stops once the lock is lost.
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        # The session is loaded before the loop runs, saving it is off-loop
+        session = DatabaseSession(
+            getattr(settings, "SNEKLOG_BOT_SESSION_NAME", "sneklog_bot")
+        )
+        client = TelegramClient(
+            session, settings.TELEGRAM_API_ID, settings.TELEGRAM_API_HASH, loop=loop
+        ).start(bot_token=settings.TELEGRAM_BOT_TOKEN)
+
+        bot = cls(client)
+        bot.register_handlers()
+
+        stop_signals = (signal.SIGINT, signal.SIGTERM)
+
+        for signum in stop_signals:
+            loop.add_signal_handler(
+                signum, lambda: loop.create_task(bot.stop(interrupted=True))
+            )
+
+        with client:
+            bot.start_background_tasks()
+
+            if leader is not None:
+                bot.watch_leader(leader)
+
+            # Handle what was missed since the stored update state
+            try:
+                loop.run_until_complete(client.catch_up())
+            except Exception as e:
+                logger.warning("Could not catch up on missed updates: %r", e)
+
+            try:
+                client.run_until_disconnected()
+            finally:
+                for signum in stop_signals:
+                    loop.remove_signal_handler(signum)
+
+                if bot._leader_task is not None:
+                    bot._leader_task.cancel()
+
+                # Unless stop() ran, the client was disconnected elsewhere
+                if not bot._stopping:
+                    loop.run_until_complete(bot.shutdown())
+
+        return bot
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .db_management import run_in_db_pool
+from .metrics import BROADCAST_DELIVERIES, BROADCAST_RATE
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastRunner:
+    """Send pending broadcasts from inside the bot process.
+
+    Recipients are streamed in batches of `batch_size` ordered by a cursor
+    that is stored with the broadcast. A delivery row is created for every
+    recipient of a batch before any of them is messaged, so a broadcast
+    that is interrupted resumes after the last batch and nobody gets the
+    message twice. Sending goes through the outbound scheduler at the
+    lowest priority, at most `concurrency` messages are in flight.
+    """
+
+    # fields
+    batch_size: int = 500
+    concurrency: int = 50
+    poll_interval: float = 10.0
+    # Seconds between throughput reports
+    report_interval: float = 10.0
+
+    # ctor
+    def __init__(self, scheduler: object, **options) -> None:
+        self.scheduler = scheduler
+
+        for name, value in options.items():
+            setattr(self, name, value)
+
+    # meths
+    async def run(self) -> None:
+        while True:
+            try:
+                broadcast = await run_in_db_pool(self.claim)
+            except Exception as e:
+                logger.error("Could not claim a broadcast: %r", e)
+                broadcast = None
+
+            if broadcast is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            try:
+                await self.send(broadcast)
+            except Exception as e:
+                # Stays running and is resumed by the next claim
+                logger.error("Broadcast %s stopped: %r", broadcast.pk, e)
+                await asyncio.sleep(self.poll_interval)
+
+    @staticmethod
+    @transaction.atomic
+    def claim() -> object:
+        """Return the oldest unfinished broadcast, marked as running."""
+        from .models import Broadcast, BroadcastDelivery
+
+        broadcast = (
+            Broadcast.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[Broadcast.PENDING, Broadcast.RUNNING])
+            .order_by("created_at")
+            .first()
+        )
+
+        if broadcast is None:
+            return None
+
+        # Whether these were sent before the interruption is unknown
+        interrupted = broadcast.deliveries.filter(
+            status=BroadcastDelivery.PENDING
+        ).update(status=BroadcastDelivery.FAILED, error="interrupted")
+
+        broadcast.failed += interrupted
+        broadcast.status = Broadcast.RUNNING
+        broadcast.started_at = broadcast.started_at or timezone.now()
+        broadcast.save(update_fields=["failed", "status", "started_at"])
+
+        return broadcast
+
+    async def send(self, broadcast: object) -> None:
+        started = time.monotonic()
+        reported = started
+        sent_before = broadcast.sent + broadcast.failed
+
+        while True:
+            batch = await run_in_db_pool(self.checkpoint, broadcast)
+
+            if batch is None:
+                break
+
+            results = await self.deliver(broadcast, batch)
+            await run_in_db_pool(self.record, broadcast, results)
+
+            now = time.monotonic()
+            rate = (broadcast.sent + broadcast.failed - sent_before) / (now - started)
+            BROADCAST_RATE.set(rate)
+
+            if now - reported >= self.report_interval:
+                reported = now
+                logger.info(
+                    "Broadcast %s: %s sent, %s failed, %.1f messages/s",
+                    broadcast.pk,
+                    broadcast.sent,
+                    broadcast.failed,
+                    rate,
+                )
+
+        BROADCAST_RATE.set(0)
+
+        logger.info(
+            "Broadcast %s %s: %s sent, %s failed in %.0fs",
+            broadcast.pk,
+            broadcast.status,
+            broadcast.sent,
+            broadcast.failed,
+            time.monotonic() - started,
+        )
+
+    def recipients(self, broadcast: object) -> list:
+        """Return the next batch as (position, chat_id) tuples."""
+        from esite.core.snapshot import get_snek_settings
+        from esite.members.models import Member
+
+        from .models import Broadcast
+
+        if broadcast.audience == Broadcast.GROUPS:
+            group_ids = get_snek_settings().group_ids
+            return [
+                (position, chat_id)
+                for position, chat_id in enumerate(group_ids, start=1)
+                if position > broadcast.cursor
+            ][: self.batch_size]
+
+        return list(
+            Member.objects.filter(is_member=True, pk__gt=broadcast.cursor)
+            .order_by("pk")
+            .values_list("pk", "telegram_user_id")[: self.batch_size]
+            .iterator()
+        )
+
+    @transaction.atomic
+    def checkpoint(self, broadcast: object) -> list:
+        """Reserve the next batch of recipients and advance the cursor.
+
+        Returns None once the broadcast is finished or was cancelled.
+        """
+        from .models import Broadcast, BroadcastDelivery
+
+        broadcast.refresh_from_db(fields=["status"])
+
+        if broadcast.status == Broadcast.CANCELLED:
+            return None
+
+        batch = self.recipients(broadcast)
+
+        if not batch:
+            broadcast.status = Broadcast.DONE
+            broadcast.finished_at = timezone.now()
+            broadcast.save(update_fields=["status", "finished_at"])
+            return None
+
+        chat_ids = [chat_id for _, chat_id in batch]
+        # A member with the same chat id twice is only messaged once
+        known = set(
+            broadcast.deliveries.filter(chat_id__in=chat_ids).values_list(
+                "chat_id", flat=True
+            )
+        )
+        new_ids = list(dict.fromkeys(c for c in chat_ids if c not in known))
+
+        BroadcastDelivery.objects.bulk_create(
+            [BroadcastDelivery(broadcast=broadcast, chat_id=c) for c in new_ids]
+        )
+
+        broadcast.cursor = batch[-1][0]
+        broadcast.save(update_fields=["cursor"])
+
+        return new_ids
+
+    async def deliver(self, broadcast: object, chat_ids: list) -> dict:
+        """Send the message to every chat, return {chat_id: error or None}."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {}
+
+        async def deliver_one(chat_id):
+            async with semaphore:
+                try:
+                    await self.scheduler.send_message(
+                        chat_id, broadcast.message, priority=self.scheduler.BROADCAST
+                    )
+                except Exception as e:
+                    results[chat_id] = repr(e)
+                else:
+                    results[chat_id] = None
+
+        await asyncio.gather(*(deliver_one(chat_id) for chat_id in chat_ids))
+
+        return results
+
+    @staticmethod
+    @transaction.atomic
+    def record(broadcast: object, results: dict) -> None:
+        from django.db.models import F
+
+        from .models import Broadcast, BroadcastDelivery
+
+        sent = [chat_id for chat_id, error in results.items() if error is None]
+        failed = {
+            chat_id: error for chat_id, error in results.items() if error is not None
+        }
+
+        deliveries = broadcast.deliveries.filter(status=BroadcastDelivery.PENDING)
+        deliveries.filter(chat_id__in=sent).update(
+            status=BroadcastDelivery.SENT, sent_at=timezone.now()
+        )
+
+        for chat_id, error in failed.items():
+            deliveries.filter(chat_id=chat_id).update(
+                status=BroadcastDelivery.FAILED, error=error
+            )
+
+        Broadcast.objects.filter(pk=broadcast.pk).update(
+            sent=F("sent") + len(sent), failed=F("failed") + len(failed)
+        )
+
+        broadcast.sent += len(sent)
+        broadcast.failed += len(failed)
+
+        BROADCAST_DELIVERIES.labels(status="sent").inc(len(sent))
+        BROADCAST_DELIVERIES.labels(status="failed").inc(len(failed))
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
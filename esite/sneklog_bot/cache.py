@@ -0,0 +1,17 @@
+from esite.core.cache import IdSetCache
+
+
+def telegram_chat_group_ids() -> object:
+    from .models import TelegramChatGroup
+
+    return TelegramChatGroup.objects.values_list("chat_id", flat=True)
+
+
+# Chat ids of all TelegramChatGroups, kept warm by their signals
+managed_chat_ids = IdSetCache(
+    telegram_chat_group_ids, "MANAGED_CHAT_CACHE_REFRESH_INTERVAL"
+)
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -1,10 +1,15 @@
-from django.conf import settings
-from django.template.loader import render_to_string
+import asyncio
+import logging
 import uuid
 
-from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .db_management import DBIO, AsyncDBIO, get_member_group_id, run_in_db_pool
+from .metrics import record_registration
+from .roster import ROSTER_MAX, roster
 
-from .db_management import DBIO
+logger = logging.getLogger(__name__)
 
 
 class SnekManagement:
@@ -23,18 +28,18 @@ class SnekManagement:
     # meths
     @classmethod
     def send_mail(self, addresses: str, registration_link: str) -> None:
-        from wagtail.admin.mail import send_mail
+        from esite.core.mail import queue_mail, render_mail_template
 
         emailheader: str = "Snek - NoTuSpam"
 
-        content = "registration_link: {registration_link}"
+        content = f"registration_link: {registration_link}"
 
-        html_message: str = render_to_string(
+        html_message: str = render_mail_template(
             "registration/registration_mail_template.html",
             {"registration_link": registration_link},
         )
 
-        send_mail(
+        queue_mail(
             "Registrierung TUWien Snek - NoTuSpam",
             f"{emailheader}\n\n{content}",
             addresses,
@@ -60,15 +65,17 @@ class SnekManagement:
             if matrikelnummer > 1679999:
                 return False
 
-            return True
-
-        if matrikelnummer > 64000000:
+        elif matrikelnummer > ROSTER_MAX:
             return False
 
+        # Check against the official roster once one was imported
+        if roster.available:
+            return matrikelnummer in roster
+
         return True
 
     @classmethod
-    def register_user(
+    async def register_user(
         cls, matrikelnummer: str, telegram_user: object, register_res=False
     ) -> bool:
         # Mail versenden -> format string -> uni spezifisch e[matrikelnummer]@student.tuwien.ac.at
@@ -78,39 +85,83 @@ class SnekManagement:
 
         matrikelnummer_int = int(matrikelnummer)
 
-        if cls.check_matrikelnummer(matrikelnummer_int):
-            if not DBIO.check_blacklist(matrikelnummer=matrikelnummer):
-                if not DBIO.check_user_id(telegram_user.id):
-
-                    # Generate correct mailaddress
-                    address = f"{matrikelnummer}@student.tuwien.ac.at"
+        if not cls.check_matrikelnummer(matrikelnummer_int):
+            record_registration(False, "invalid_matrikelnummer")
+            return register_res
 
-                    # Add e to email address to match correct format
-                    address = "e" + address
+        if await AsyncDBIO.check_blacklist(matrikelnummer=matrikelnummer):
+            record_registration(False, "blacklisted")
+            return register_res
 
-                    addresses: tuple = (address,)
+        if await AsyncDBIO.check_user_id(telegram_user.id):
+            record_registration(False, "already_registered")
+            return register_res
 
-                    registration_token: str = str(uuid.uuid4())
+        # Reject taken registrations before paying for the password hash
+        if await run_in_db_pool(DBIO.is_taken, matrikelnummer, telegram_user.id):
+            record_registration(False, "already_registered")
+            return register_res
 
-                    if DBIO.register(
-                        matrikelnummer=matrikelnummer,
-                        user_id=telegram_user.id,
-                        username=telegram_user.username,
-                        first_name=telegram_user.first_name,
-                        last_name=telegram_user.first_name,
-                        email=address,
-                        registration_token=registration_token,
-                    ):
+        # Off the db pool, the hash does not need a connection
+        password = await asyncio.get_running_loop().run_in_executor(
+            None, DBIO.hash_password, matrikelnummer
+        )
 
-                        registration_link: str = (
-                            f"{settings.BASE_URL}/{registration_token}"
-                        )
+        # Generate correct mailaddress
+        address = f"{matrikelnummer}@student.tuwien.ac.at"
+
+        # Add e to email address to match correct format
+        address = "e" + address
+
+        addresses: tuple = (address,)
+
+        registration_token: str = str(uuid.uuid4())
+
+        if await run_in_db_pool(
+            cls.register_and_notify,
+            addresses=addresses,
+            matrikelnummer=matrikelnummer,
+            user_id=telegram_user.id,
+            username=telegram_user.username,
+            first_name=telegram_user.first_name,
+            last_name=telegram_user.first_name,
+            email=address,
+            registration_token=registration_token,
+            password=password,
+        ):
+            record_registration(True, "registered")
+            register_res = True
+        else:
+            # Most likely the matrikelnummer is already taken
+            record_registration(False, "database")
 
-                        cls.send_mail(addresses, registration_link)
+        return register_res
 
-                        register_res = True
+    @classmethod
+    def register_and_notify(cls, addresses: tuple, **kwargs) -> bool:
+        """Register the member and queue the activation mail atomically.
+
+        Only the inserts run in the transaction, the password is hashed by
+        the caller beforehand.
+        """
+        try:
+            with transaction.atomic():
+                if not DBIO.register(**kwargs):
+                    return False
+
+                registration_link: str = (
+                    f"{settings.BASE_URL}/{kwargs['registration_token']}"
+                )
+
+                cls.send_mail(addresses, registration_link)
+        except IntegrityError as e:
+            # Foreign keys are checked on commit, the group might have been
+            # recreated
+            get_member_group_id.cache_clear()
+            logger.warning("Could not register %s: %r", kwargs["matrikelnummer"], e)
+            return False
 
-        return register_res
+        return True
 
     @staticmethod
     def activate_member(registration_token: str, activate_res: bool = False) -> bool:
@@ -120,9 +171,16 @@ class SnekManagement:
         return activate_res
 
     @staticmethod
-    @sync_to_async
-    def check_new_member(telegram_user: object) -> bool:
-        if DBIO.check_user_id(telegram_user.id):
+    async def check_new_members(user_ids: set) -> set:
+        """Return the ids of all given users that are registered members."""
+        if not user_ids:
+            return set()
+
+        return await AsyncDBIO.filter_user_ids(user_ids)
+
+    @staticmethod
+    async def check_new_member(telegram_user: object) -> bool:
+        if await AsyncDBIO.check_user_id(telegram_user.id):
             pass
 
         return False
@@ -1,8 +1,14 @@
-import json
+import asyncio
+import functools
 import hashlib
-from django.core.serializers.json import DjangoJSONEncoder
-from asgiref.sync import sync_to_async
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
 
 
 class DBIO:
@@ -10,6 +16,26 @@ class DBIO:
     # props
 
     # meths
+    @staticmethod
+    def is_taken(matrikelnummer: str, user_id: int) -> bool:
+        """Whether the matrikelnummer or the Telegram user is registered."""
+        from esite.members.models import Member
+
+        return (
+            get_user_model().objects.filter(username=f"snek-{matrikelnummer}").exists()
+            or Member.objects.filter(telegram_user_id=user_id).exists()
+        )
+
+    @staticmethod
+    def hash_password(matrikelnummer: str) -> str:
+        """PBKDF2 takes longer than the inserts, call it outside transactions."""
+        from django.contrib.auth.hashers import make_password
+
+        if getattr(settings, "SNEKLOG_BOT_MEMBER_PASSWORDS", True):
+            return make_password(hashlib.sha256(str.encode(matrikelnummer)).hexdigest())
+
+        return make_password(None)
+
     @staticmethod
     def register(
         matrikelnummer: str,
@@ -19,50 +45,48 @@ class DBIO:
         last_name: str,
         email: str,
         registration_token: str,
+        password: str,
         add_res: bool = False,
     ) -> bool:
-        from django.contrib.auth.models import Group
         from esite.members.models import Member
 
-        try:
-            user = get_user_model().objects.create(
-                username=f"snek-{matrikelnummer}",
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                is_active=False,
-            )
+        User = get_user_model()
 
-            user.set_password(hashlib.sha256(str.encode(matrikelnummer)).hexdigest())
-            # user.groups.add(Group.objects.get(name="ohrwurm-supervisor"))
-            user.groups.add(Group.objects.get(name="snek-member"))
+        try:
+            with transaction.atomic():
+                user = User.objects.create(
+                    username=f"snek-{matrikelnummer}",
+                    first_name=first_name,
+                    last_name=last_name,
+                    email=email,
+                    password=password,
+                    is_active=False,
+                )
 
-            user.save()
+                user.groups.add(get_member_group_id())
 
-            member = Member.objects.create(
-                user=user,
-                matrikelnummer=matrikelnummer,
-                telegram_user_id=user_id,
-                telegram_username=username,
-                registration_token=registration_token,
-            )
+                Member.objects.create(
+                    user=user,
+                    matrikelnummer=matrikelnummer,
+                    telegram_user_id=user_id,
+                    telegram_username=username,
+                    registration_token=registration_token,
+                )
 
-            member.save()
-
-            add_res = True
+                add_res = True
 
         except Exception as e:
-            print(e)
+            # The group might have been recreated
+            get_member_group_id.cache_clear()
+            logger.warning("Could not register %s: %r", matrikelnummer, e)
 
         return add_res
 
     @staticmethod
     def check_blacklist(matrikelnummer: str, check_res: bool = True) -> bool:
-        from .models import SnekSettings
-
-        blacklist = json.loads(SnekSettings.for_site(1).blacklist)["blacklist"]
+        from esite.core.snapshot import get_snek_settings
 
-        if not matrikelnummer in blacklist:
+        if not get_snek_settings().is_blacklisted(matrikelnummer):
             check_res = False
 
         return check_res
@@ -77,13 +101,41 @@ class DBIO:
 
     @staticmethod
     def check_user_id(user_id, check_res: bool = False) -> bool:
-        from esite.members.models import Member
+        from esite.members.cache import known_member_ids
 
-        if Member.objects.filter(telegram_user_id=user_id).exists():
+        if user_id in known_member_ids:
             check_res = True
 
         return check_res
 
+    @staticmethod
+    def filter_user_ids(user_ids: set) -> set:
+        """Return the subset of user_ids that belong to a member, in one query."""
+        from esite.members.models import Member
+
+        return set(
+            Member.objects.filter(telegram_user_id__in=user_ids).values_list(
+                "telegram_user_id", flat=True
+            )
+        )
+
+    @staticmethod
+    def is_managed_chat(chat_id: int) -> bool:
+        from .cache import managed_chat_ids
+
+        return chat_id in managed_chat_ids
+
+    @staticmethod
+    def register_chat(chat_id: int, name: str) -> bool:
+        """Record a managed group, returns False if it was already known."""
+        from .models import TelegramChatGroup
+
+        _, created = TelegramChatGroup.objects.update_or_create(
+            chat_id=chat_id, defaults={"name": (name or "")[:39]}
+        )
+
+        return created
+
     @staticmethod
     def activate_member(registration_token: str, activate_res: bool = False) -> bool:
         from esite.members.models import Member
@@ -98,10 +150,111 @@ class DBIO:
             wannabemember.save()
 
             activate_res = True
-            print("hell yeah")
 
         return activate_res
 
     @staticmethod
     def disable_user(disable_res: bool = False) -> bool:
         return disable_res
+
+
+@functools.lru_cache(maxsize=None)
+def get_member_group_id() -> int:
+    """Return the id of the snek-member group, looked up once per process."""
+    from django.contrib.auth.models import Group
+
+    return Group.objects.values_list("pk", flat=True).get(name="snek-member")
+
+
+_executor: ThreadPoolExecutor = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Return the bounded thread pool all bot ORM calls are run on."""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "SNEKLOG_BOT_DB_WORKERS", 4),
+            thread_name_prefix="sneklog_bot-db",
+        )
+
+    return _executor
+
+
+def _call_with_fresh_connection(func, *args, **kwargs):
+    # Mirror the request lifecycle: drop connections that are broken or past
+    # CONN_MAX_AGE before and after every unit of work.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_pool(func, *args, **kwargs):
+    """Run a blocking ORM (or other I/O) call without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(
+        get_db_executor(),
+        functools.partial(_call_with_fresh_connection, func, *args, **kwargs),
+    )
+
+
+class AsyncDBIO:
+    """Async facade over DBIO for the bot handlers.
+
+    Every call is executed on the bot's dedicated db thread pool, so a slow
+    query only occupies a worker thread and never the Telethon event loop.
+    """
+
+    # meths
+    @staticmethod
+    async def register(**kwargs) -> bool:
+        return await run_in_db_pool(DBIO.register, **kwargs)
+
+    @staticmethod
+    async def check_blacklist(matrikelnummer: str) -> bool:
+        return await run_in_db_pool(DBIO.check_blacklist, matrikelnummer=matrikelnummer)
+
+    @staticmethod
+    async def check_user_id(user_id) -> bool:
+        from esite.members.cache import known_member_ids
+
+        # Answer from the warm cache without leaving the event loop
+        is_member = known_member_ids.get(user_id)
+
+        if is_member is None:
+            is_member = await run_in_db_pool(DBIO.check_user_id, user_id)
+
+        return is_member
+
+    @staticmethod
+    async def filter_user_ids(user_ids: set) -> set:
+        from esite.members.cache import known_member_ids
+
+        if known_member_ids.is_fresh:
+            return {user_id for user_id in user_ids if known_member_ids.get(user_id)}
+
+        return await run_in_db_pool(DBIO.filter_user_ids, user_ids)
+
+    @staticmethod
+    async def is_managed_chat(chat_id: int) -> bool:
+        from .cache import managed_chat_ids
+
+        # Answer from the warm cache without leaving the event loop
+        is_managed = managed_chat_ids.get(chat_id)
+
+        if is_managed is None:
+            is_managed = await run_in_db_pool(DBIO.is_managed_chat, chat_id)
+
+        return is_managed
+
+    @staticmethod
+    async def register_chat(chat_id: int, name: str) -> bool:
+        return await run_in_db_pool(DBIO.register_chat, chat_id, name)
+
+    @staticmethod
+    async def activate_member(registration_token: str) -> bool:
+        return await run_in_db_pool(DBIO.activate_member, registration_token)
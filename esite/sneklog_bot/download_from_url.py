@@ -1,6 +1,15 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
 import os
 import time
 
+import httpx
+
+logger = logging.getLogger(__name__)
+
 
 def get_size(size):
     units = ["Bytes", "KB", "MB", "GB", "TB", "PB", "EB"]
@@ -29,6 +38,296 @@ def time_formatter(milliseconds: int) -> str:
     return tmp[:-2]
 
 
+class Downloader:
+    """Stream a URL to disk, resumable and optionally in parallel ranges.
+
+    Data is written to `<path>.part` in `chunk_size` pieces, the byte
+    ranges that are done are recorded in `<path>.part.json` so an
+    interrupted download continues where it stopped. Servers that support
+    Range requests get large files split into up to `parallel` ranges.
+    The file is hashed in order while it streams, memory use does not
+    depend on the file size.
+
+    `progress_callback(current, total)` is awaited after every chunk, e.g.
+    a `file_handler.ProgressReporter` or
+    `lambda c, t: file_handler.progress(c, t, event, start)`.
+    """
+
+    # fields
+    chunk_size: int = 256 * 1024
+    parallel: int = 4
+    # Files smaller than this are never split
+    min_part_size: int = 8 * 1024 * 1024
+    retries: int = 3
+    # Seconds between writes of the resume state
+    state_interval: float = 2.0
+
+    # ctor
+    def __init__(
+        self,
+        url: str,
+        path: str,
+        client: object = None,
+        hash_name: str = "sha256",
+        progress_callback: object = None,
+        headers: dict = None,
+        **options,
+    ) -> None:
+        self.url = url
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.state_path = f"{path}.part.json"
+        self.client = client
+        self.hash_name = hash_name
+        self.progress_callback = progress_callback
+        self.headers = headers or {}
+
+        for name, value in options.items():
+            if not hasattr(type(self), name):
+                raise TypeError(f"Unknown option {name}")
+            setattr(self, name, value)
+
+        self.size = None
+        self.validator = None
+        self.resumable = False
+        self.ranges = []
+        self.hasher = hashlib.new(hash_name)
+        self.hashed = 0
+
+        self._fd = None
+        self._catching_up = False
+        self._hash_lock = asyncio.Lock()
+        self._state_saved = 0.0
+
+    # props
+    @property
+    def downloaded(self) -> int:
+        return sum(pos - start for start, pos, end in self.ranges)
+
+    @property
+    def frontier(self) -> int:
+        """Offset up to which the file is written without gaps."""
+        for start, pos, end in self.ranges:
+            if end is None or pos < end:
+                return pos
+
+        return self.size or 0
+
+    # meths
+    async def run(self) -> str:
+        """Download the file and return its hex digest."""
+        client = self.client or httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0)
+        )
+
+        try:
+            await self._prepare(client)
+
+            self._fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+            tasks = [
+                asyncio.ensure_future(self._fetch(client, i))
+                for i in range(len(self.ranges))
+            ]
+
+            try:
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # Stop the other ranges before the file is closed
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+
+                await self._catch_up_hash()
+                await self._run_blocking(os.fsync, self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+                self._save_state(force=True)
+        finally:
+            if self.client is None:
+                await client.aclose()
+
+        os.replace(self.part_path, self.path)
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.state_path)
+
+        return self.hasher.hexdigest()
+
+    async def _prepare(self, client: object) -> None:
+        response = await client.head(
+            self.url, headers=self.headers, allow_redirects=True
+        )
+
+        # Servers that do not answer HEAD are downloaded in one piece
+        headers = response.headers if response.status_code < 400 else {}
+
+        length = headers.get("Content-Length")
+        self.size = int(length) if length and length.isdigit() else None
+        self.validator = headers.get("ETag") or headers.get("Last-Modified")
+        self.resumable = bool(self.size) and headers.get("Accept-Ranges") == "bytes"
+
+        if self.resumable and self._load_state():
+            return
+
+        # Start from scratch
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.part_path)
+
+        if not self.resumable:
+            self.ranges = [[0, 0, self.size]]
+            return
+
+        count = max(1, min(self.parallel, self.size // self.min_part_size))
+        step = -(-self.size // count)
+
+        self.ranges = [
+            [start, start, min(start + step, self.size)]
+            for start in range(0, self.size, step)
+        ]
+
+    def _load_state(self) -> bool:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if (
+            state.get("url") != self.url
+            or state.get("size") != self.size
+            or state.get("validator") != self.validator
+            or not os.path.exists(self.part_path)
+        ):
+            return False
+
+        self.ranges = state["ranges"]
+
+        return True
+
+    def _save_state(self, force: bool = False) -> None:
+        now = time.monotonic()
+
+        if not force and now - self._state_saved < self.state_interval:
+            return
+
+        self._state_saved = now
+
+        if not self.resumable:
+            return
+
+        tmp_path = f"{self.state_path}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "url": self.url,
+                    "size": self.size,
+                    "validator": self.validator,
+                    "ranges": self.ranges,
+                },
+                f,
+            )
+
+        os.replace(tmp_path, self.state_path)
+
+    async def _fetch(self, client: object, index: int) -> None:
+        part = self.ranges[index]
+
+        for attempt in range(self.retries + 1):
+            start, pos, end = part
+
+            if end is not None and pos >= end:
+                break
+
+            headers = dict(self.headers)
+            if self.resumable and (pos or end < self.size):
+                headers["Range"] = f"bytes={pos}-{end - 1}"
+
+            try:
+                async with client.stream("GET", self.url, headers=headers) as response:
+                    response.raise_for_status()
+
+                    if "Range" in headers and response.status_code != 206:
+                        raise DownloadError(f"{self.url} ignored the Range header")
+
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        if end is not None:
+                            chunk = chunk[: end - part[1]]
+
+                        await self._run_blocking(os.pwrite, self._fd, chunk, part[1])
+                        await self._hash_chunk(part[1], chunk)
+
+                        part[1] += len(chunk)
+                        self._save_state()
+
+                        if self.progress_callback is not None:
+                            await self.progress_callback(
+                                self.downloaded, self.size or part[1]
+                            )
+
+                        if end is not None and part[1] >= end:
+                            break
+
+                if end is None:
+                    # Unknown length, the stream ending means we are done
+                    part[2] = self.size = part[1]
+                    break
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt == self.retries or not self.resumable:
+                    raise DownloadError(f"Downloading {self.url} failed: {e!r}") from e
+
+                logger.warning("Retrying range %s of %s: %r", index, self.url, e)
+                await asyncio.sleep(2**attempt)
+
+        if part[2] is not None and part[1] < part[2]:
+            raise DownloadError(f"{self.url} ended after {part[1]} bytes")
+
+        # Earlier ranges might have been waiting for this one to be hashed
+        await self._catch_up_hash()
+
+    async def _hash_chunk(self, offset: int, chunk: bytes) -> None:
+        # The common case, data arrives right where the hash stopped
+        if offset == self.hashed and not self._catching_up:
+            self.hasher.update(chunk)
+            self.hashed += len(chunk)
+
+    async def _catch_up_hash(self) -> None:
+        """Hash everything written without gaps by reading it back."""
+        async with self._hash_lock:
+            self._catching_up = True
+
+            try:
+                while self.hashed < self.frontier:
+                    length = min(self.chunk_size, self.frontier - self.hashed)
+                    data = await self._run_blocking(
+                        os.pread, self._fd, length, self.hashed
+                    )
+
+                    if not data:
+                        break
+
+                    self.hasher.update(data)
+                    self.hashed += len(data)
+            finally:
+                self._catching_up = False
+
+    async def _run_blocking(self, func: object, *args) -> object:
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+class DownloadError(Exception):
+    pass
+
+
+async def download_from_url(url: str, path: str, **kwargs) -> str:
+    """Download `url` to `path` and return the hex digest of the file."""
+    return await Downloader(url, path, **kwargs).run()
+
+
 # SPDX-License-Identifier: (MIT)
 # Copyright © 2021 snek.at
 
@@ -0,0 +1,194 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import time
+from collections import Counter
+
+from telethon import events
+
+logger = logging.getLogger(__name__)
+
+
+class FakeUser:
+    def __init__(self, id: int, username: str = None, first_name: str = "Snek"):
+        self.id = id
+        self.username = username or f"snek{id}"
+        self.first_name = first_name
+        self.last_name = None
+        self.bot = False
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, chat_id: int, sender_id: int, text: str = "") -> None:
+        self.id = next(self._ids)
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.message = self.text = text
+        self.out = False
+        self.fwd_from = None
+        self.media = self.photo = self.document = None
+
+
+class FakeNewMessageEvent:
+    """Quacks like events.NewMessage.Event for the parts the bot uses."""
+
+    builder = events.NewMessage
+
+    def __init__(self, client: "FakeClient", message: FakeMessage) -> None:
+        self.client = client
+        self.message = message
+        self.chat_id = message.chat_id
+        self.sender_id = message.sender_id
+        self.is_private = message.chat_id > 0
+        self.pattern_match = None
+
+    async def get_sender(self) -> FakeUser:
+        return FakeUser(self.sender_id)
+
+    async def respond(self, message: str, **kwargs) -> FakeMessage:
+        return await self.client.send_message(self.chat_id, message)
+
+    async def reply(self, message: str, **kwargs) -> FakeMessage:
+        return await self.client.send_message(self.chat_id, message)
+
+
+class FakeChatActionEvent:
+    """Quacks like events.ChatAction.Event for user joins."""
+
+    builder = events.ChatAction
+
+    def __init__(self, client: "FakeClient", chat_id: int, user_ids: list) -> None:
+        self.client = client
+        self.chat_id = chat_id
+        self.user_ids = user_ids
+        self.user_joined = True
+        self.user_added = False
+        self.user_left = False
+        self.user_kicked = False
+        self.action_message = FakeMessage(chat_id, user_ids[0])
+
+
+class FakeClient:
+    """Offline stand-in for TelegramClient.
+
+    Handlers are matched with the real Telethon event builders and every
+    outgoing request just sleeps for `latency` seconds and is counted in
+    `calls`, so handler code runs unchanged without network access.
+    """
+
+    # ctor
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls = Counter()
+        # {chat_id: [user_id, ...]} returned by iter_participants
+        self.participants = {}
+        self._handlers = []
+
+    # meths
+    def add_event_handler(self, callback: object, event: object = None) -> None:
+        if event is None or inspect.isclass(event):
+            event = (event or events.Raw)()
+
+        self._handlers.append((event, callback))
+
+    def on(self, event: object) -> object:
+        def decorator(callback):
+            self.add_event_handler(callback, event)
+            return callback
+
+        return decorator
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def _request(self, name: str) -> None:
+        self.calls[name] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_input_entity(self, peer: object) -> object:
+        return peer
+
+    async def send_message(self, entity: object, message: str, **kwargs):
+        await self._request("send_message")
+        return FakeMessage(entity, 0, message)
+
+    async def forward_messages(self, entity: object, messages: object, **kwargs):
+        await self._request("forward_messages")
+
+    async def delete_messages(self, entity: object, message_ids: object, **kwargs):
+        await self._request("delete_messages")
+
+    async def iter_participants(self, entity: object, **kwargs):
+        await self._request("iter_participants")
+
+        for user_id in self.participants.get(entity, ()):
+            yield FakeUser(user_id)
+
+    async def dispatch(self, event: object) -> float:
+        """Run all matching handlers like Telethon does, return the latency."""
+        started = time.perf_counter()
+
+        for builder, callback in self._handlers:
+            if not isinstance(builder, event.builder):
+                continue
+
+            if not builder.resolved:
+                await builder.resolve(self)
+
+            result = builder.filter(event)
+            if inspect.isawaitable(result):
+                result = await result
+            if not result:
+                continue
+
+            try:
+                await callback(event)
+            except events.StopPropagation:
+                break
+            except Exception:
+                self.calls["handler_errors"] += 1
+                logger.exception("Unhandled exception on %s", callback.__name__)
+
+        return time.perf_counter() - started
+
+    def new_message(self, text: str, sender_id: int, chat_id: int = None):
+        return FakeNewMessageEvent(
+            self,
+            FakeMessage(sender_id if chat_id is None else chat_id, sender_id, text),
+        )
+
+    def chat_action(self, chat_id: int, user_ids: list) -> FakeChatActionEvent:
+        return FakeChatActionEvent(self, chat_id, user_ids)
+
+    async def replay(self, stream: object, rate: float = 0) -> list:
+        """Dispatch events at `rate` events per second (0 means unthrottled).
+
+        Like Telethon every event is handled in its own task. Returns a list
+        of (event, latency in seconds) tuples.
+        """
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        tasks = []
+
+        for i, event in enumerate(stream):
+            if rate:
+                delay = started + i / rate - time.perf_counter()
+
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            tasks.append((event, loop.create_task(self.dispatch(event))))
+
+        return [(event, await task) for event, task in tasks]
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
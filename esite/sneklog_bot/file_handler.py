@@ -1,30 +1,188 @@
-import datetime
-import os
+import asyncio
+import logging
 import time
+from collections import deque
+
+from telethon.errors import FloodWaitError, MessageNotModifiedError
+
 from .download_from_url import get_size, time_formatter
+from .metrics import record_flood_wait
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    """Show the progress of a transfer by editing one message.
+
+    Only the latest state is kept. The message is edited at most every
+    `min_interval` seconds, updates in between are coalesced, the final
+    100% update is always sent. Speed and ETA are averaged over the last
+    `window` seconds instead of the whole transfer.
+    """
+
+    # fields
+    title: str = "Yummy, Master gave sum juicy sound UwU"
+
+    # ctor
+    def __init__(
+        self,
+        message: object,
+        min_interval: float = 3.0,
+        window: float = 10.0,
+        start: float = None,
+    ) -> None:
+        self.message = message
+        self.min_interval = min_interval
+        self.window = window
+        self.started = time.monotonic()
+        # Elapsed time is reported relative to the wall clock start if given
+        self.start = start or time.time()
+
+        self.current = 0
+        self.total = 0
+        self.updated = self.started
+
+        self._samples = deque()
+        self._editing = False
+        self._last_edit = float("-inf")
+        self._last_text = None
+
+    # props
+    @property
+    def finished(self) -> bool:
+        return bool(self.total) and self.current >= self.total
+
+    @property
+    def speed(self) -> float:
+        """Bytes per second over the moving window."""
+        if len(self._samples) < 2:
+            elapsed = self.updated - self.started
+            return self.current / elapsed if elapsed > 0 else 0.0
+
+        (first_time, first_bytes), (last_time, last_bytes) = (
+            self._samples[0],
+            self._samples[-1],
+        )
+
+        if last_time <= first_time:
+            return 0.0
+
+        return (last_bytes - first_bytes) / (last_time - first_time)
+
+    # meths
+    async def __call__(self, current: int, total: int) -> None:
+        await self.update(current, total)
+
+    async def update(self, current: int, total: int) -> None:
+        now = time.monotonic()
+
+        self.current, self.total, self.updated = current, total, now
+
+        self._samples.append((now, current))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+        if self._editing:
+            # The running edit picks up the latest state
+            return
+
+        if not self.finished and now - self._last_edit < self.min_interval:
+            return
+
+        await self.flush()
+
+    def render(self) -> str:
+        percentage = self.current * 100 / self.total if self.total else 0
+        speed = self.speed
+        elapsed_time = round(time.time() - self.start) * 1000
+
+        if self.finished:
+            time_to_completion = 0
+        elif speed > 0:
+            time_to_completion = round((self.total - self.current) / speed) * 1000
+        else:
+            time_to_completion = None
+
+        if time_to_completion is None:
+            eta = ttc = "unknown"
+        else:
+            eta = time_formatter(elapsed_time + time_to_completion) or "0s"
+            ttc = time_formatter(time_to_completion) or "0s"
+
+        return f"""{self.title}
+**Downloading : {"%.2f" % (percentage)}%
+File Size:** {get_size(self.total)}
+**Speed:** {get_size(speed)}/s
+**Downloaded:** {get_size(self.current)}
+**ETA:** {eta}
+**TTC:** {ttc}"""
+
+    async def flush(self) -> None:
+        self._editing = True
+
+        try:
+            while True:
+                state = (self.current, self.total)
+
+                await self._edit(self.render())
+
+                # Only go again if the final update arrived during the edit
+                if state == (self.current, self.total) or not self.finished:
+                    break
+        finally:
+            self._editing = False
+
+    async def _edit(self, text: str) -> None:
+        if text == self._last_text:
+            return
+
+        try:
+            await self.message.edit(text)
+        except MessageNotModifiedError:
+            pass
+        except FloodWaitError as e:
+            record_flood_wait("edit_message", e.seconds)
+
+            if not self.finished:
+                # Skip intermediate updates until Telegram lets us edit again
+                self._last_edit = time.monotonic() + e.seconds
+                return
+
+            await asyncio.sleep(e.seconds)
+            return await self._edit(text)
+        except Exception as e:
+            logger.warning("Could not update the progress message: %r", e)
+
+        self._last_edit = time.monotonic()
+        self._last_text = text
+
+
+# Reporters of the transfers using the `progress` callback, by message
+_reporters = {}
+_reporter_ttl = 3600.0
 
 
 async def progress(current, total, event, start):
     """Generic progress_callback for both
     upload.py and download.py"""
-    now = time.time()
-    diff = now - start
-    if round(diff % 1.00) == 0 or current == total:
-        percentage = current * 100 / total
-        speed = current / diff
-        elapsed_time = round(diff) * 1000
-        time_to_completion = round((total - current) / speed) * 1000
-        estimated_total_time = elapsed_time + time_to_completion
-
-        progress_str = f"""Yummy, Master gave sum juicy sound UwU
-**Downloading : {"%.2f" % (percentage)}%
-File Size:** {get_size(total)}
-**Speed:** {get_size(speed)}/s
-**Downloaded:** {get_size(current)}
-**ETA:** {time_formatter(estimated_total_time)}
-**TTC:** {time_formatter(time_to_completion) or "0s"}"""
+    key = id(event)
+    reporter = _reporters.get(key)
+
+    if reporter is None or reporter.message is not event:
+        now = time.monotonic()
+
+        # Forget transfers that stopped without finishing
+        for stale in [
+            k for k, r in _reporters.items() if now - r.updated > _reporter_ttl
+        ]:
+            del _reporters[stale]
+
+        reporter = _reporters[key] = ProgressReporter(event, start=start)
+
+    await reporter.update(current, total)
 
-        await event.edit(progress_str)
+    if reporter.finished:
+        _reporters.pop(key, None)
 
 
 # SPDX-License-Identifier: (MIT)
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import io
+import logging
+import queue
+import time
+
+from django.core.files import File
+
+from .db_management import run_in_db_pool
+from .file_handler import progress
+
+logger = logging.getLogger(__name__)
+
+# Mime types stored as SNEKImage when sent as a file, Wagtail can render these
+IMAGE_MIME_TYPES = ("image/jpeg", "image/png", "image/gif", "image/webp")
+
+
+class TelegramFileStream:
+    """Read only file object fed with chunks from the event loop.
+
+    The loop `put()`s chunks into a small bounded queue, a worker thread
+    `read()`s them while Django storage writes the file. At most
+    `max_chunks` chunks are held in memory, the SHA1 Wagtail uses as
+    `file_hash` is computed on the way through. `read()` gives up after
+    `read_timeout` seconds without a chunk.
+    """
+
+    # fields
+    read_timeout: float = 60.0
+
+    # ctor
+    def __init__(self, name: str, size: int = None, max_chunks: int = 8) -> None:
+        self.name = name
+        self.size = size
+        self.hasher = hashlib.sha1()
+        self.closed = False
+
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = b""
+        self._eof = False
+
+    # meths
+    async def put(self, chunk: object, consumer: asyncio.Future) -> None:
+        """Queue a chunk, waits while the consumer is behind."""
+        while True:
+            try:
+                self._queue.put_nowait(chunk)
+                return
+            except queue.Full:
+                if consumer.done():
+                    # The consumer failed and will never drain the queue
+                    consumer.result()
+                    raise RuntimeError("The file consumer stopped early")
+
+                await asyncio.sleep(0.01)
+
+    async def finish(self, consumer: asyncio.Future) -> None:
+        await self.put(None, consumer)
+
+    def abort(self, error: Exception) -> None:
+        """Make `read()` raise error, never blocks so it works when cancelled."""
+        while True:
+            try:
+                self._queue.put_nowait(error)
+                return
+            except queue.Full:
+                # The chunks will not be stored anyway
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            try:
+                chunk = self._queue.get(timeout=self.read_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No data for {self.name} within the timeout")
+
+            if chunk is None:
+                self._eof = True
+            elif isinstance(chunk, Exception):
+                raise chunk
+            else:
+                self.hasher.update(chunk)
+                self._buffer += chunk
+
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+
+        return data
+
+    def seekable(self) -> bool:
+        return False
+
+    def seek(self, *args) -> None:
+        raise io.UnsupportedOperation("seek")
+
+    def tell(self) -> None:
+        raise io.UnsupportedOperation("tell")
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FileIngest:
+    """Store documents and photos sent to the bot by admins in Wagtail.
+
+    The file is streamed from `iter_download` straight into the storage of
+    SNEKDocument or SNEKImage, the storage write and the ORM save run on
+    the bot's db thread pool.
+    """
+
+    # fields
+    # Telegram requires a multiple of 4 KB and at most 512 KB per request
+    request_size: int = 512 * 1024
+
+    # ctor
+    def __init__(self, client: object, scheduler: object) -> None:
+        self.client = client
+        self.scheduler = scheduler
+
+    # meths
+    @staticmethod
+    def is_ingestable(message: object) -> bool:
+        return bool(message.photo or message.document)
+
+    @staticmethod
+    def is_image(message: object) -> bool:
+        return bool(message.photo) or message.file.mime_type in IMAGE_MIME_TYPES
+
+    async def ingest(self, event: object) -> object:
+        message = event.message
+
+        name = message.file.name or f"telegram-{message.id}{message.file.ext or ''}"
+        size = message.file.size
+        title = message.text or name
+
+        status = await self.scheduler.reply(event, f"Uploading {name}...")
+        start = time.time()
+
+        model_name = (
+            "images.SNEKImage" if self.is_image(message) else "documents.SNEKDocument"
+        )
+
+        stream = TelegramFileStream(name, size)
+        consumer = asyncio.ensure_future(
+            run_in_db_pool(self.store, model_name, stream, title)
+        )
+
+        received = 0
+
+        try:
+            async for chunk in self.client.iter_download(
+                message.media, request_size=self.request_size, file_size=size
+            ):
+                await stream.put(bytes(chunk), consumer)
+                received += len(chunk)
+
+                await progress(received, size or received, status, start)
+
+            await stream.finish(consumer)
+        except BaseException as e:
+            # Also when cancelled, the consumer thread waits for chunks
+            stream.abort(IOError(f"The download of {name} stopped early"))
+
+            if isinstance(e, asyncio.CancelledError):
+                consumer.cancel()
+            else:
+                await asyncio.gather(consumer, return_exceptions=True)
+
+            raise
+
+        return await consumer
+
+    @staticmethod
+    def store(model_name: str, stream: TelegramFileStream, title: str) -> object:
+        from django.apps import apps
+
+        model = apps.get_model(model_name)
+
+        obj = model(title=title[:255])
+        # Writes the file chunk by chunk, images read their dimensions back
+        obj.file.save(stream.name, File(stream, name=stream.name), save=False)
+
+        obj.file_size = stream.size or obj.file.size
+        obj.file_hash = stream.hasher.hexdigest()
+        obj.save()
+
+        logger.info("Stored %s %s from Telegram", model_name, obj.pk)
+
+        return obj
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
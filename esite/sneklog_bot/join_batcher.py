@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+
+from .club_management import SnekManagement
+
+logger = logging.getLogger(__name__)
+
+
+class JoinBatcher:
+    """Coalesce bursts of ChatAction joins.
+
+    The service messages of joins arriving within `window` seconds are
+    removed with one `delete_messages` call per chat. With `on_unregistered`
+    the joined users are also checked against the members with one query.
+    """
+
+    # fields
+    # Telegram deletes at most 100 messages per request
+    max_delete_batch: int = 100
+
+    # ctor
+    def __init__(
+        self,
+        scheduler: object,
+        window: float = 0.5,
+        max_batch_size: int = 500,
+        max_queue_size: int = 10000,
+        on_unregistered: object = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self.window = window
+        self.max_batch_size = max_batch_size
+        # Coroutine function called with {chat_id: {user_id, ...}}
+        self.on_unregistered = on_unregistered
+        self.dropped = 0
+
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+
+    # props
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    # meths
+    def submit(self, event: object) -> bool:
+        action_message = event.action_message
+
+        try:
+            self._queue.put_nowait(
+                (
+                    event.chat_id,
+                    tuple(event.user_ids or ()),
+                    action_message.id if action_message else None,
+                )
+            )
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+        return True
+
+    async def run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.window
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self.process(batch)
+            except Exception as e:
+                logger.error("Could not process %s joins: %r", len(batch), e)
+
+    async def process(self, batch: list) -> None:
+        joined = {}
+        service_messages = {}
+
+        for chat_id, user_ids, message_id in batch:
+            joined.setdefault(chat_id, set()).update(user_ids)
+
+            if message_id is not None:
+                service_messages.setdefault(chat_id, []).append(message_id)
+
+        for chat_id, message_ids in service_messages.items():
+            for i in range(0, len(message_ids), self.max_delete_batch):
+                await self._delete(chat_id, message_ids[i : i + self.max_delete_batch])
+
+        if self.on_unregistered is None:
+            # Nobody acts on unregistered users, save the query
+            return
+
+        members = await SnekManagement.check_new_members(set().union(*joined.values()))
+
+        unregistered = {
+            chat_id: user_ids - members
+            for chat_id, user_ids in joined.items()
+            if user_ids - members
+        }
+
+        if unregistered:
+            await self.on_unregistered(unregistered)
+
+    async def _delete(self, chat_id: int, message_ids: list) -> None:
+        try:
+            # The scheduler waits out FloodWaits and retries for us
+            await self.scheduler.delete_messages(chat_id, message_ids)
+        except Exception as e:
+            logger.error(
+                "Could not delete %s join messages in %s: %r",
+                len(message_ids),
+                chat_id,
+                e,
+            )
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
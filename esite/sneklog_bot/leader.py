@@ -0,0 +1,149 @@
+import fcntl
+import logging
+import os
+import zlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """Leader election for the sneklog bot.
+
+    Telegram only allows one connection per bot token to receive updates,
+    so exactly one `run_sneklog_bot` process may run the bot at a time.
+    On PostgreSQL a session level advisory lock is used, which also works
+    across containers. Every other database falls back to an exclusive
+    lock on a local file.
+    """
+
+    # fields
+    name: str = "sneklog_bot"
+
+    # ctor
+    def __init__(self, name: str = None, path: str = None) -> None:
+        self.name = name or self.name
+        self.path = path or getattr(
+            settings,
+            "SNEKLOG_BOT_LOCK_FILE",
+            os.path.join(settings.BASE_DIR, f"{self.name}.lock"),
+        )
+        self._connection = None
+        self._file = None
+
+    # props
+    @property
+    def key(self) -> int:
+        # Advisory locks are identified by a signed 64 bit integer
+        return zlib.crc32(self.name.encode())
+
+    @property
+    def is_held(self) -> bool:
+        return self._connection is not None or self._file is not None
+
+    # meths
+    def acquire(self) -> bool:
+        """Try to become the leader without blocking."""
+        if self.is_held:
+            return True
+
+        if connections[DEFAULT_DB_ALIAS].vendor == "postgresql":
+            return self._acquire_advisory_lock()
+
+        return self._acquire_file_lock()
+
+    def check(self) -> bool:
+        """Whether the lock is still held.
+
+        The advisory lock is gone with the session holding it, so this
+        checks that its connection is still alive. Can be called from any
+        thread.
+        """
+        if self._file is not None:
+            return True
+
+        if self._connection is None:
+            return False
+
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except DatabaseError as e:
+            logger.error("Lost advisory lock %s for %s: %r", self.key, self.name, e)
+
+            try:
+                self._connection.close()
+            except DatabaseError:
+                pass
+
+            self._connection = None
+            return False
+
+        return True
+
+    def release(self) -> None:
+        if self._connection is not None:
+            try:
+                with self._connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", [self.key])
+            finally:
+                self._connection.close()
+                self._connection = None
+
+        if self._file is not None:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            finally:
+                self._file.close()
+                self._file = None
+
+    def _acquire_advisory_lock(self) -> bool:
+        # Use a dedicated connection, the lock lives as long as the session
+        # and must not be dropped by the bot closing stale connections.
+        connection = connections[DEFAULT_DB_ALIAS].copy()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.key])
+            (locked,) = cursor.fetchone()
+
+        if not locked:
+            connection.close()
+            return False
+
+        # The bot checks the lock from a thread pool
+        connection.inc_thread_sharing()
+        self._connection = connection
+        logger.info("Acquired advisory lock %s for %s", self.key, self.name)
+
+        return True
+
+    def _acquire_file_lock(self) -> bool:
+        lock_file = open(self.path, "a+")
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+
+        self._file = lock_file
+        logger.info("Acquired file lock %s for %s", self.path, self.name)
+
+        return True
+
+    def __enter__(self) -> "LeaderLock":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,131 @@
+import asyncio
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from esite.sneklog_bot.fake_client import FakeClient
+
+
+def percentile(values: list, percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+
+    index = max(int(round(percent / 100 * len(values))) - 1, 0)
+
+    return values[min(index, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Replay synthetic Telegram traffic against the bot handlers offline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=5000)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Events per second, 0 dispatches as fast as possible.",
+        )
+        parser.add_argument("--senders", type=int, default=1000)
+        parser.add_argument("--chats", type=int, default=10)
+        parser.add_argument(
+            "--join-ratio",
+            type=float,
+            default=0.5,
+            help="Share of ChatAction joins, the rest are private messages.",
+        )
+        parser.add_argument(
+            "--registration-ratio",
+            type=float,
+            default=0.0,
+            help="Share of messages that are matrikelnummern. "
+            + "WARNING: these register real users in the configured database.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=50.0,
+            help="Simulated Telegram round trip time in milliseconds.",
+        )
+        parser.add_argument("--seed", type=int, default=None)
+
+    @staticmethod
+    def chat_id(index: int) -> int:
+        return -1000000000000 - index
+
+    def handle(self, *args, **options):
+        from esite.sneklog_bot.bot import SnekBot
+        from esite.sneklog_bot.cache import managed_chat_ids
+
+        rng = random.Random(options["seed"])
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        # Treat the synthetic groups as managed, in this process only
+        managed_chat_ids.load()
+        for i in range(options["chats"]):
+            managed_chat_ids.add(self.chat_id(i))
+
+        client = FakeClient(latency=options["latency"] / 1000)
+        bot = SnekBot(client)
+        bot.register_handlers()
+
+        def stream():
+            for _ in range(options["events"]):
+                sender_id = rng.randrange(1, options["senders"] + 1)
+
+                if rng.random() < options["join_ratio"]:
+                    chat_id = self.chat_id(rng.randrange(options["chats"]))
+                    yield client.chat_action(chat_id, [sender_id])
+                elif rng.random() < options["registration_ratio"]:
+                    matrikelnummer = str(rng.randrange(11700000, 12200000))
+                    yield client.new_message(matrikelnummer, sender_id)
+                else:
+                    yield client.new_message(rng.choice(["/start", "hallo"]), sender_id)
+
+        async def run():
+            # Sweeps and broadcasts would write the fake client's answers to the
+            # configured database
+            bot.start_background_tasks(database_workers=False)
+            started = time.perf_counter()
+
+            try:
+                results = await client.replay(stream(), rate=options["rate"])
+            finally:
+                await bot.shutdown()
+
+            return results, time.perf_counter() - started
+
+        try:
+            results, elapsed = loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+        by_kind = {}
+        for event, latency in results:
+            by_kind.setdefault(type(event).__name__, []).append(latency)
+        by_kind["all"] = [latency for _, latency in results]
+
+        self.stdout.write(
+            f"{len(results)} events in {elapsed:.2f}s "
+            + f"({len(results) / elapsed:.1f} events/s)"
+        )
+
+        for kind, latencies in by_kind.items():
+            latencies.sort()
+            self.stdout.write(
+                f"{kind:>22}: n={len(latencies)} "
+                + " ".join(
+                    f"p{p}={percentile(latencies, p) * 1000:.2f}ms"
+                    for p in (50, 95, 99)
+                )
+            )
+
+        self.stdout.write(f"requests: {dict(client.calls)}")
+        self.stdout.write(f"rate limited: {bot.rate_limiter.rejected}")
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
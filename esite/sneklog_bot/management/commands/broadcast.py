@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from esite.sneklog_bot.models import Broadcast
+
+
+class Command(BaseCommand):
+    help = "Queue a broadcast, it is sent by the running sneklog bot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("message", nargs="?")
+        parser.add_argument(
+            "--audience",
+            choices=[Broadcast.MEMBERS, Broadcast.GROUPS],
+            default=Broadcast.MEMBERS,
+        )
+        parser.add_argument(
+            "--cancel", type=int, metavar="ID", help="Cancel a queued broadcast."
+        )
+
+    def handle(self, *args, **options):
+        if options["cancel"]:
+            cancelled = Broadcast.objects.filter(
+                pk=options["cancel"],
+                status__in=[Broadcast.PENDING, Broadcast.RUNNING],
+            ).update(status=Broadcast.CANCELLED)
+
+            if not cancelled:
+                raise CommandError(f"No unfinished broadcast {options['cancel']}.")
+
+            self.stdout.write(f"Cancelled broadcast {options['cancel']}.")
+            return
+
+        if not options["message"]:
+            raise CommandError("A message is required.")
+
+        broadcast = Broadcast.objects.create(
+            message=options["message"], audience=options["audience"]
+        )
+
+        self.stdout.write(f"Queued broadcast {broadcast.pk}.")
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from esite.sneklog_bot.roster import Roster, get_roster_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace the roster of valid matrikelnummern, "
+        "reads one matrikelnummer per line."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="Roster to import, - for stdin.")
+        parser.add_argument("--path", help="Where to write the roster.")
+
+    def read(self, lines):
+        for line_number, line in enumerate(lines, start=1):
+            # Accept e12345678 like in the mail addresses
+            value = line.strip().lstrip("eE")
+
+            if not value:
+                continue
+
+            if not value.isdigit():
+                raise CommandError(f"Line {line_number}: not a matrikelnummer")
+
+            yield int(value)
+
+    def handle(self, *args, **options):
+        path = options["path"] or get_roster_path()
+        f = sys.stdin if options["file"] == "-" else open(options["file"])
+
+        try:
+            count = Roster.write(self.read(f), path)
+        except ValueError as e:
+            raise CommandError(e)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        self.stdout.write(f"Imported {count} matrikelnummern to {path}.")
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
@@ -0,0 +1,100 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from prometheus_client import start_http_server
+
+from esite.sneklog_bot.leader import LeaderLock
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the sneklog Telegram bot. Only one instance per deployment becomes leader."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--standby",
+            action="store_true",
+            help="Wait until the current leader is gone instead of exiting.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=10.0,
+            help="Seconds between leader election attempts in standby mode.",
+        )
+        parser.add_argument(
+            "--max-backoff",
+            type=float,
+            default=60.0,
+            help="Upper bound in seconds for the restart delay after a crash.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=getattr(settings, "SNEKLOG_BOT_METRICS_PORT", None),
+            help="Serve Prometheus metrics on this local port.",
+        )
+
+    def handle(self, *args, **options):
+        metrics_started = False
+
+        with LeaderLock() as lock:
+            while True:
+                while not lock.acquire():
+                    if not options["standby"]:
+                        self.stderr.write("Another sneklog bot is already running.")
+                        return
+
+                    time.sleep(options["poll_interval"])
+
+                if options["metrics_port"] and not metrics_started:
+                    start_http_server(options["metrics_port"], addr="127.0.0.1")
+                    metrics_started = True
+
+                self.stdout.write("snek bot started...")
+
+                if not self.supervise(lock, max_backoff=options["max_backoff"]):
+                    return
+
+                self.stderr.write("snek bot lost the leader lock.")
+
+    def supervise(self, lock: LeaderLock, max_backoff: float) -> bool:
+        """Run the bot and restart it with exponential backoff when it dies.
+
+        Returns True if the leader lock was lost, False if the bot was
+        stopped.
+        """
+        from esite.sneklog_bot.bot import SnekBot
+
+        backoff = 1.0
+
+        while True:
+            started = time.monotonic()
+
+            try:
+                bot = SnekBot.main(leader=lock)
+            except KeyboardInterrupt:
+                return False
+            except Exception as e:
+                self.stderr.write(f"snek bot crashed: {e!r}")
+            else:
+                if bot.interrupted:
+                    return False
+
+                self.stderr.write("snek bot disconnected.")
+
+            if not lock.check():
+                return True
+
+            # Reset the delay once the bot has been up for a while
+            if time.monotonic() - started > max_backoff:
+                backoff = 1.0
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
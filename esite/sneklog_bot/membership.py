@@ -0,0 +1,235 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from telethon.errors import FloodWaitError
+
+from .db_management import run_in_db_pool
+from .metrics import record_flood_wait
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipTracker:
+    """Keep the ChatMembership table in sync with the managed groups.
+
+    Joins and leaves from ChatAction events are collected in memory and
+    written every `flush_interval` seconds with one bulk insert and one
+    delete per chat. Every `sweep_interval` seconds the participants of
+    each managed group are fetched with `iter_participants` and the table
+    is reconciled by set difference, which repairs anything the events
+    missed, e.g. while the bot was offline. Users whose joins or leaves
+    were flushed while their chat was swept are left as the events say,
+    the participant list may be older. Chats swept within
+    `sweep_interval`, e.g. before a restart, are skipped.
+    """
+
+    # fields
+    flush_interval: float = 5.0
+    # Rows per INSERT or DELETE statement
+    batch_size: int = 1000
+
+    # ctor
+    def __init__(self, client: object, sweep_interval: float = None) -> None:
+        self.client = client
+        self.sweep_interval = sweep_interval or getattr(
+            settings, "SNEKLOG_BOT_MEMBERSHIP_SWEEP_INTERVAL", 6 * 60 * 60
+        )
+
+        # {(chat_id, user_id): True for joined, False for left}
+        self._pending = {}
+        # {chat_id: user ids flushed while the chat is swept}
+        self._sweeping = {}
+        # Writes of flushes and sweeps must not interleave
+        self._lock = asyncio.Lock()
+
+    # props
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    # meths
+    def joined(self, chat_id: int, user_ids: list) -> None:
+        for user_id in user_ids:
+            self._pending[(chat_id, user_id)] = True
+
+    def left(self, chat_id: int, user_ids: list) -> None:
+        for user_id in user_ids:
+            self._pending[(chat_id, user_id)] = False
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Could not update memberships: %r", e)
+
+    async def run_sweeps(self) -> None:
+        while True:
+            delay = self.sweep_interval
+
+            try:
+                delay = await self.sweep()
+            except Exception as e:
+                logger.error("Membership sweep failed: %r", e)
+
+            await asyncio.sleep(delay)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+
+        joined, left = {}, {}
+        for (chat_id, user_id), is_member in pending.items():
+            (joined if is_member else left).setdefault(chat_id, set()).add(user_id)
+
+            if chat_id in self._sweeping:
+                self._sweeping[chat_id].add(user_id)
+
+        async with self._lock:
+            await run_in_db_pool(self.apply, joined, left)
+
+    async def sweep(self) -> float:
+        """Sweep the chats that are due, returns the seconds until the next."""
+        from .models import TelegramChatGroup
+
+        chats = await run_in_db_pool(
+            lambda: list(TelegramChatGroup.objects.values_list("chat_id", "swept_at"))
+        )
+
+        due = timezone.now() - timedelta(seconds=self.sweep_interval)
+        delay = self.sweep_interval
+
+        for chat_id, swept_at in chats:
+            if swept_at is not None and swept_at > due:
+                delay = min(delay, (swept_at - due).total_seconds())
+                continue
+
+            await self.sweep_chat(chat_id)
+
+        return delay
+
+    async def sweep_chat(self, chat_id: int) -> None:
+        self._sweeping[chat_id] = set()
+
+        try:
+            user_ids = await self.participants(chat_id)
+        except Exception as e:
+            logger.warning("Could not list the participants of %s: %r", chat_id, e)
+            return
+        finally:
+            # Flushes from here on are ordered by the lock
+            flushed = self._sweeping.pop(chat_id)
+
+        async with self._lock:
+            added, removed = await run_in_db_pool(
+                self.reconcile, chat_id, user_ids, flushed
+            )
+
+        logger.info(
+            "Membership sweep of %s: %s participants, %s added, %s removed",
+            chat_id,
+            len(user_ids),
+            added,
+            removed,
+        )
+
+    async def participants(self, chat_id: int) -> set:
+        while True:
+            try:
+                return {
+                    user.id
+                    async for user in self.client.iter_participants(chat_id)
+                    if not user.bot
+                }
+            except FloodWaitError as e:
+                record_flood_wait("iter_participants", e.seconds)
+                await asyncio.sleep(e.seconds)
+
+    @transaction.atomic
+    def apply(self, joined: dict, left: dict) -> None:
+        for chat_id, user_ids in joined.items():
+            self._insert(chat_id, user_ids)
+
+        for chat_id, user_ids in left.items():
+            self._delete(chat_id, user_ids)
+
+    @transaction.atomic
+    def reconcile(self, chat_id: int, user_ids: set, flushed: set = ()) -> tuple:
+        """Make the stored members of chat_id equal user_ids.
+
+        The users in flushed joined or left after user_ids was fetched.
+        """
+        from .models import ChatMembership, TelegramChatGroup
+
+        stored = set(
+            ChatMembership.objects.filter(chat_id=chat_id)
+            .values_list("telegram_user_id", flat=True)
+            .iterator()
+        )
+
+        added = user_ids - stored - set(flushed)
+        removed = stored - user_ids - set(flushed)
+
+        self._insert(chat_id, added)
+        self._delete(chat_id, removed)
+
+        TelegramChatGroup.objects.filter(chat_id=chat_id).update(
+            swept_at=timezone.now()
+        )
+
+        return len(added), len(removed)
+
+    def _insert(self, chat_id: int, user_ids: set) -> None:
+        from .models import ChatMembership
+
+        ChatMembership.objects.bulk_create(
+            [
+                ChatMembership(chat_id=chat_id, telegram_user_id=user_id)
+                for user_id in user_ids
+            ],
+            batch_size=self.batch_size,
+            # Joins can race with a sweep
+            ignore_conflicts=True,
+        )
+
+    def _delete(self, chat_id: int, user_ids: set) -> None:
+        from .models import ChatMembership
+
+        user_ids = list(user_ids)
+
+        for i in range(0, len(user_ids), self.batch_size):
+            ChatMembership.objects.filter(
+                chat_id=chat_id, telegram_user_id__in=user_ids[i : i + self.batch_size]
+            ).delete()
+
+
+def unregistered_participants(chat_id: int) -> object:
+    """Members of a managed group that never registered with the bot."""
+    from esite.members.models import Member
+
+    from .models import ChatMembership
+
+    return ChatMembership.objects.filter(chat_id=chat_id).exclude(
+        telegram_user_id__in=Member.objects.values("telegram_user_id")
+    )
+
+
+def chats_of(telegram_user_id: int) -> object:
+    """The managed groups a Telegram user is in."""
+    from .models import TelegramChatGroup
+
+    return TelegramChatGroup.objects.filter(
+        memberships__telegram_user_id=telegram_user_id
+    )
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
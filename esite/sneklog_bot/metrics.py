@@ -0,0 +1,89 @@
+import asyncio
+import functools
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from telethon import events
+
+HANDLER_SECONDS = Histogram(
+    "sneklog_bot_handler_seconds", "Latency of the bot event handlers", ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "sneklog_bot_handler_errors", "Unhandled exceptions in handlers", ["handler"]
+)
+REGISTRATIONS = Counter(
+    "sneklog_bot_registrations",
+    "Registration attempts by result and reason",
+    ["result", "reason"],
+)
+RATE_LIMITED = Counter(
+    "sneklog_bot_rate_limited_messages", "Incoming messages dropped by the rate limiter"
+)
+FLOOD_WAITS = Counter(
+    "sneklog_bot_flood_waits", "FloodWait errors returned by Telegram", ["request"]
+)
+FLOOD_WAIT_SECONDS = Counter(
+    "sneklog_bot_flood_wait_seconds", "Seconds Telegram asked us to wait", ["request"]
+)
+QUEUE_DEPTH = Gauge(
+    "sneklog_bot_queue_depth", "Items waiting in the bot's internal queues", ["queue"]
+)
+BROADCAST_DELIVERIES = Counter(
+    "sneklog_bot_broadcast_deliveries", "Broadcast messages by outcome", ["status"]
+)
+BROADCAST_RATE = Gauge(
+    "sneklog_bot_broadcast_messages_per_second", "Throughput of the running broadcast"
+)
+LOOP_LAG_SECONDS = Histogram(
+    "sneklog_bot_event_loop_lag_seconds",
+    "Delay of a periodic timer on the event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+def instrument_handler(callback: object, name: str = None) -> object:
+    """Wrap an event handler to record its latency and unhandled errors."""
+    name = name or callback.__name__
+    latency = HANDLER_SECONDS.labels(handler=name)
+    errors = HANDLER_ERRORS.labels(handler=name)
+
+    @functools.wraps(callback)
+    async def handler(event):
+        started = time.perf_counter()
+
+        try:
+            return await callback(event)
+        except events.StopPropagation:
+            raise
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+
+    return handler
+
+
+def record_registration(accepted: bool, reason: str) -> None:
+    REGISTRATIONS.labels(
+        result="accepted" if accepted else "rejected", reason=reason
+    ).inc()
+
+
+def record_flood_wait(request: str, seconds: float) -> None:
+    FLOOD_WAITS.labels(request=request).inc()
+    FLOOD_WAIT_SECONDS.labels(request=request).inc(seconds)
+
+
+async def sample_loop_lag(interval: float = 0.5) -> None:
+    """Measure how late a timer fires, a blocked loop shows up as lag."""
+    loop = asyncio.get_event_loop()
+
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(loop.time() - expected, 0))
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
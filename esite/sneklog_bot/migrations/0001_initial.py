@@ -0,0 +1,96 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramSession",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("dc_id", models.IntegerField(default=0)),
+                ("server_address", models.CharField(blank=True, max_length=255)),
+                ("port", models.IntegerField(blank=True, null=True)),
+                ("auth_key", models.BinaryField(blank=True, null=True)),
+                ("takeout_id", models.BigIntegerField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TelegramUpdateState",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("entity_id", models.BigIntegerField()),
+                ("pts", models.IntegerField()),
+                ("qts", models.IntegerField()),
+                ("date", models.DateTimeField()),
+                ("seq", models.IntegerField()),
+                ("unread_count", models.IntegerField()),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="update_states",
+                        to="sneklog_bot.telegramsession",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("session", "entity_id")},
+            },
+        ),
+        migrations.CreateModel(
+            name="TelegramSessionEntity",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("entity_id", models.BigIntegerField()),
+                ("access_hash", models.BigIntegerField()),
+                ("username", models.CharField(blank=True, max_length=255, null=True)),
+                ("phone", models.CharField(blank=True, max_length=32, null=True)),
+                ("name", models.CharField(blank=True, max_length=255, null=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entities",
+                        to="sneklog_bot.telegramsession",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("session", "entity_id")},
+            },
+        ),
+    ]
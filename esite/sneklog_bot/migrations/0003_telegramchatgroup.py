@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sneklog_bot", "0002_broadcast"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramChatGroup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("chat_id", models.BigIntegerField(unique=True)),
+                ("name", models.CharField(blank=True, max_length=39, null=True)),
+                ("registered_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
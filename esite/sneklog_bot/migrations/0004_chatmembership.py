@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sneklog_bot", "0003_telegramchatgroup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatMembership",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("telegram_user_id", models.BigIntegerField(db_index=True)),
+                ("joined_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "chat",
+                    models.ForeignKey(
+                        db_column="chat_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to="sneklog_bot.telegramchatgroup",
+                        to_field="chat_id",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("chat", "telegram_user_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sneklog_bot", "0004_chatmembership"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="telegramchatgroup",
+            name="swept_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
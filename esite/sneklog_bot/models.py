@@ -37,7 +37,7 @@ from bifrost.publisher.options import PublisherOptions
 #     read_singular_permission=login_required,
 # )
 class TelegramChat(models.Model):
-    chat_id = models.IntegerField(null=True, blank=True)
+    chat_id = models.BigIntegerField(unique=True)
 
     graphql_fields = [
         GraphQLString(
@@ -56,7 +56,12 @@ class TelegramChat(models.Model):
 #     read_singular_permission=login_required,
 # )
 class TelegramChatGroup(TelegramChat):
+    """A group managed by the bot, added with /register."""
+
     name = models.CharField(null=True, blank=True, max_length=39)
+    registered_at = models.DateTimeField(auto_now_add=True)
+    # Last membership sweep, see `esite.sneklog_bot.membership`
+    swept_at = models.DateTimeField(null=True, blank=True)
 
     graphql_fields = TelegramChat.graphql_fields + [
         GraphQLString(
@@ -66,8 +71,145 @@ class TelegramChatGroup(TelegramChat):
         ),
     ]
 
+    def __str__(self):
+        return self.name or str(self.chat_id)
+
+
+class TelegramSession(models.Model):
+    """Telethon session of the bot, see `esite.sneklog_bot.session`."""
+
+    name = models.CharField(max_length=255, unique=True)
+    dc_id = models.IntegerField(default=0)
+    server_address = models.CharField(max_length=255, blank=True)
+    port = models.IntegerField(null=True, blank=True)
+    auth_key = models.BinaryField(null=True, blank=True)
+    takeout_id = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class TelegramSessionEntity(models.Model):
+    """Access hash and names of a user, chat or channel seen by the bot."""
+
+    session = models.ForeignKey(
+        TelegramSession, on_delete=models.CASCADE, related_name="entities"
+    )
+    entity_id = models.BigIntegerField()
+    access_hash = models.BigIntegerField()
+    username = models.CharField(max_length=255, null=True, blank=True)
+    phone = models.CharField(max_length=32, null=True, blank=True)
+    name = models.CharField(max_length=255, null=True, blank=True)
+
     class Meta:
-        abstract = True
+        unique_together = [("session", "entity_id")]
+
+
+class TelegramUpdateState(models.Model):
+    """Last known update state, used to catch up on missed updates."""
+
+    session = models.ForeignKey(
+        TelegramSession, on_delete=models.CASCADE, related_name="update_states"
+    )
+    entity_id = models.BigIntegerField()
+    pts = models.IntegerField()
+    qts = models.IntegerField()
+    date = models.DateTimeField()
+    seq = models.IntegerField()
+    unread_count = models.IntegerField()
+
+    class Meta:
+        unique_together = [("session", "entity_id")]
+
+
+class ChatMembership(models.Model):
+    """A Telegram user in a managed group, see `esite.sneklog_bot.membership`."""
+
+    chat = models.ForeignKey(
+        TelegramChatGroup,
+        to_field="chat_id",
+        db_column="chat_id",
+        on_delete=models.CASCADE,
+        related_name="memberships",
+    )
+    telegram_user_id = models.BigIntegerField(db_index=True)
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [("chat", "telegram_user_id")]
+
+
+class Broadcast(models.Model):
+    """A message sent by the bot to every member or every managed group."""
+
+    MEMBERS = "members"
+    GROUPS = "groups"
+    AUDIENCE_CHOICES = [
+        (MEMBERS, "All active members"),
+        (GROUPS, "All managed groups"),
+    ]
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (CANCELLED, "Cancelled"),
+    ]
+
+    message = models.TextField()
+    audience = models.CharField(max_length=16, choices=AUDIENCE_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+
+    # Checkpoint, recipients up to this position have delivery rows
+    cursor = models.BigIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    panels = [
+        FieldPanel("message"),
+        FieldPanel("audience"),
+        FieldPanel("status"),
+    ]
+
+    def __str__(self):
+        return f"{self.get_audience_display()}: {self.message[:50]}"
+
+
+class BroadcastDelivery(models.Model):
+    """One recipient of a broadcast.
+
+    The row is created before the message is sent, a row that is still
+    pending after a crash is never sent again.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    broadcast = models.ForeignKey(
+        Broadcast, on_delete=models.CASCADE, related_name="deliveries"
+    )
+    chat_id = models.BigIntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [("broadcast", "chat_id")]
 
 
 # SPDX-License-Identifier: (EUPL-1.2)
@@ -0,0 +1,220 @@
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Per sender and global limits, override with settings.SNEKLOG_BOT_RATE_LIMIT
+DEFAULT_RATE_LIMIT = {
+    # Tokens per second and bucket size for every Telegram sender
+    "rate": 0.2,
+    "burst": 5,
+    # Tokens per second and bucket size shared by all senders
+    "global_rate": 30.0,
+    "global_burst": 60,
+    # Number of sender buckets kept in memory
+    "max_senders": 10000,
+    # Optional, e.g. "redis://localhost:6379/1" to share buckets between processes
+    "redis_url": None,
+}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    # ctor
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    # meths
+    def consume(self, tokens: float = 1, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+
+        self.tokens = self.available(now)
+        self.updated = max(now, self.updated)
+
+        if self.tokens < tokens:
+            return False
+
+        self.tokens -= tokens
+
+        return True
+
+    def delay(self, tokens: float = 1, now: float = None) -> float:
+        """Seconds until `tokens` can be consumed."""
+        now = time.monotonic() if now is None else now
+
+        return max(tokens - self.available(now), 0) / self.rate
+
+    def available(self, now: float) -> float:
+        # now can predate a bucket created while handling the same message
+        elapsed = max(now - self.updated, 0)
+
+        return min(self.capacity, self.tokens + elapsed * self.rate)
+
+
+class RateLimiter:
+    """In-memory token buckets per sender plus one global bucket."""
+
+    # ctor
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        global_rate: float,
+        global_burst: float,
+        max_senders: int = 10000,
+        **kwargs,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_senders = max_senders
+        self.rejected = 0
+
+        self._global = TokenBucket(global_rate, global_burst)
+        self._senders = OrderedDict()
+
+    # meths
+    async def allow(self, sender_id: int) -> bool:
+        now = time.monotonic()
+
+        bucket = self._senders.get(sender_id)
+
+        if bucket is None:
+            bucket = self._senders[sender_id] = TokenBucket(self.rate, self.burst)
+
+            if len(self._senders) > self.max_senders:
+                # Forget the least recently seen sender
+                self._senders.popitem(last=False)
+        else:
+            self._senders.move_to_end(sender_id)
+
+        # A message rejected by one bucket must not use up the other one
+        if bucket.delay(now=now) or self._global.delay(now=now):
+            self.rejected += 1
+            return False
+
+        bucket.consume(now=now)
+        self._global.consume(now=now)
+
+        return True
+
+
+class RedisRateLimiter(RateLimiter):
+    """Token buckets stored in Redis, shared by every process.
+
+    While Redis is unavailable the in-memory buckets are used, reconnects
+    are attempted with exponential backoff.
+    """
+
+    # KEYS: bucket keys, ARGV: now, then rate and burst per key
+    script = """
+    local now = tonumber(ARGV[1])
+    local state = {}
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[i * 2])
+        local burst = tonumber(ARGV[i * 2 + 1])
+        local bucket = redis.call("HMGET", key, "tokens", "updated")
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + (now - updated) * rate)
+        if tokens < 1 then
+            return 0
+        end
+        state[i] = tokens
+    end
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[i * 2])
+        local burst = tonumber(ARGV[i * 2 + 1])
+        redis.call("HSET", key, "tokens", state[i] - 1, "updated", now)
+        redis.call("EXPIRE", key, math.ceil(burst / rate) + 1)
+    end
+    return 1
+    """
+
+    # fields
+    key_prefix: str = "sneklog_bot:ratelimit"
+    # Seconds, doubled for every failed reconnect
+    base_backoff: float = 1.0
+    max_backoff: float = 60.0
+
+    # ctor
+    def __init__(
+        self, redis_url: str, global_rate: float, global_burst: float, **kwargs
+    ):
+        super().__init__(global_rate=global_rate, global_burst=global_burst, **kwargs)
+        self.redis_url = redis_url
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self._redis = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+    # meths
+    async def allow(self, sender_id: int) -> bool:
+        import aioredis
+
+        if self._redis is None and time.monotonic() < self._retry_at:
+            return await super().allow(sender_id)
+
+        try:
+            if self._redis is None:
+                self._redis = await aioredis.create_redis_pool(self.redis_url)
+
+            allowed = await self._redis.eval(
+                self.script,
+                keys=[
+                    f"{self.key_prefix}:{sender_id}",
+                    f"{self.key_prefix}:global",
+                ],
+                args=[
+                    time.time(),
+                    self.rate,
+                    self.burst,
+                    self.global_rate,
+                    self.global_burst,
+                ],
+            )
+        except Exception as e:
+            # Fall back to the local buckets while Redis is unavailable
+            self._disconnect()
+            backoff = min(self.base_backoff * 2**self._failures, self.max_backoff)
+            self._failures += 1
+            self._retry_at = time.monotonic() + backoff
+            logger.warning(
+                "Redis rate limiter failed, reconnecting in %.0fs: %r", backoff, e
+            )
+            return await super().allow(sender_id)
+
+        self._failures = 0
+
+        if not allowed:
+            self.rejected += 1
+
+        return bool(allowed)
+
+    def _disconnect(self) -> None:
+        if self._redis is not None:
+            self._redis.close()
+            self._redis = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    options = {
+        **DEFAULT_RATE_LIMIT,
+        **getattr(settings, "SNEKLOG_BOT_RATE_LIMIT", {}),
+    }
+
+    if options["redis_url"]:
+        return RedisRateLimiter(**options)
+
+    return RateLimiter(**options)
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
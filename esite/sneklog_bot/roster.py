@@ -0,0 +1,133 @@
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Highest matrikelnummer that can be valid, see SnekManagement.check_matrikelnummer
+ROSTER_MAX = 64000000
+# One bit per number from 0 to ROSTER_MAX, about 8 MB
+ROSTER_SIZE = ROSTER_MAX // 8 + 1
+
+
+def get_roster_path() -> str:
+    return getattr(
+        settings,
+        "SNEKLOG_BOT_ROSTER_PATH",
+        os.path.join(settings.BASE_DIR, "matrikelnummer.roster"),
+    )
+
+
+class Roster:
+    """Read only allowlist of matrikelnummern, a bitset mapped from disk.
+
+    Bit n is set if matrikelnummer n is valid. The file is memory mapped,
+    so all processes share the same pages and a lookup is one byte read.
+    `write()` replaces the file atomically, readers notice the new file
+    within `check_interval` seconds and keep using the old mapping until
+    then. Without a roster file `available` is False.
+    """
+
+    # fields
+    check_interval: float = 60.0
+
+    # ctor
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+
+        self._mmap = None
+        self._stat = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    # props
+    @property
+    def available(self) -> bool:
+        self._refresh()
+
+        return self._mmap is not None
+
+    # meths
+    def __contains__(self, matrikelnummer: int) -> bool:
+        self._refresh()
+
+        if self._mmap is None or not 0 <= matrikelnummer <= ROSTER_MAX:
+            return False
+
+        return bool(self._mmap[matrikelnummer >> 3] >> (matrikelnummer & 7) & 1)
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return
+
+        with self._lock:
+            self._checked = now
+            path = self.path or get_roster_path()
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._mmap = self._stat = None
+                return
+
+            if self._stat is not None and (stat.st_ino, stat.st_mtime_ns) == self._stat:
+                return
+
+            if stat.st_size != ROSTER_SIZE:
+                logger.error("Ignoring roster %s of %s bytes", path, stat.st_size)
+                return
+
+            with open(path, "rb") as f:
+                # The mapping stays valid after the file is closed or replaced
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            self._stat = (stat.st_ino, stat.st_mtime_ns)
+            logger.info("Loaded roster %s", path)
+
+    @staticmethod
+    def write(matrikelnummern: object, path: str = None) -> int:
+        """Atomically replace the roster, returns the number of entries."""
+        path = path or get_roster_path()
+        bits = bytearray(ROSTER_SIZE)
+        count = 0
+
+        for matrikelnummer in matrikelnummern:
+            if not 0 <= matrikelnummer <= ROSTER_MAX:
+                raise ValueError(f"Matrikelnummer out of range: {matrikelnummer}")
+
+            byte, bit = matrikelnummer >> 3, 1 << (matrikelnummer & 7)
+
+            if not bits[byte] & bit:
+                bits[byte] |= bit
+                count += 1
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".roster-")
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(bits)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        return count
+
+
+roster = Roster()
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
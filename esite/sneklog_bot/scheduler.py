@@ -0,0 +1,358 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+
+from telethon.errors import FloodWaitError, SlowModeWaitError
+
+from .metrics import QUEUE_DEPTH, record_flood_wait
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram's documented limits, override with settings.SNEKLOG_BOT_OUTBOUND_LIMITS
+DEFAULT_OUTBOUND_LIMITS = {
+    # About 30 messages per second for the whole bot
+    "global_rate": 25.0,
+    "global_burst": 30,
+    # About one message per second in a private chat
+    "chat_rate": 1.0,
+    "chat_burst": 3,
+    # At most 20 messages per minute in a group
+    "group_rate": 20 / 60,
+    "group_burst": 5,
+}
+
+
+class _Job:
+    __slots__ = (
+        "priority",
+        "seq",
+        "chat_id",
+        "method",
+        "args",
+        "kwargs",
+        "chat_limited",
+        "future",
+    )
+
+    def __init__(self, priority, seq, chat_id, method, args, kwargs, chat_limited):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_limited = chat_limited
+        self.future = asyncio.get_event_loop().create_future()
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundScheduler:
+    """Send every outgoing request through one priority queue.
+
+    Requests are dispatched by priority (replies before actions before
+    audit forwards before broadcasts) as long as the global and the per
+    chat token buckets allow it, a chat that is out of tokens does not
+    hold up other chats.
+    Requests for a chat that has to wait are parked in a queue of that
+    chat until it may send again, so they are not looked at on every
+    pass. A FloodWait pauses dispatching and puts the request back in the
+    queue instead of stalling the handler that sent it. Chat ids are
+    resolved to InputPeers once and cached.
+
+    The methods mirror TelegramClient so the scheduler can be handed to
+    code that expects a client.
+    """
+
+    # fields
+    REPLY: int = 0
+    ACTION: int = 1
+    AUDIT: int = 2
+    BROADCAST: int = 3
+
+    max_in_flight: int = 16
+    max_chats: int = 10000
+
+    # ctor
+    def __init__(self, client: object, **limits) -> None:
+        self.client = client
+        self.limits = {**DEFAULT_OUTBOUND_LIMITS, **limits}
+
+        self._global = TokenBucket(
+            self.limits["global_rate"], self.limits["global_burst"]
+        )
+        self._buckets = OrderedDict()
+        self._peers = OrderedDict()
+        self._paused_until = 0.0
+        self._chat_paused_until = {}
+
+        self._heap = []
+        # {chat_id: heap of jobs} for chats that have to wait
+        self._parked = {}
+        self._parked_count = 0
+        # (ready_at, seq, chat_id) to release the parked chats, one at a time
+        self._timers = []
+        self._armed = set()
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        QUEUE_DEPTH.labels(queue="outbound").set_function(lambda: self.depth)
+
+    # props
+    @property
+    def depth(self) -> int:
+        return len(self._heap) + self._parked_count
+
+    # meths
+    def submit(
+        self,
+        priority: int,
+        entity: object,
+        method: str,
+        *args,
+        chat_limited: bool = True,
+        **kwargs,
+    ) -> asyncio.Future:
+        """Queue `client.<method>(entity, *args, **kwargs)`."""
+        job = _Job(
+            priority, next(self._seq), entity, method, args, kwargs, chat_limited
+        )
+        self._push(job)
+
+        return job.future
+
+    async def send_message(self, entity: object, message: str, **kwargs) -> object:
+        priority = kwargs.pop("priority", self.REPLY)
+
+        return await self.submit(priority, entity, "send_message", message, **kwargs)
+
+    async def forward_messages(
+        self, entity: object, messages: object, from_peer: object = None, **kwargs
+    ) -> object:
+        priority = kwargs.pop("priority", self.AUDIT)
+
+        if from_peer is not None:
+            from_peer = await self.resolve(from_peer)
+
+        return await self.submit(
+            priority,
+            entity,
+            "forward_messages",
+            messages,
+            from_peer=from_peer,
+            **kwargs,
+        )
+
+    async def delete_messages(
+        self, entity: object, message_ids: object, **kwargs
+    ) -> object:
+        priority = kwargs.pop("priority", self.ACTION)
+
+        # Deletes do not count towards the message limits of a chat
+        return await self.submit(
+            priority,
+            entity,
+            "delete_messages",
+            message_ids,
+            chat_limited=False,
+            **kwargs,
+        )
+
+    async def respond(self, event: object, message: str, **kwargs) -> object:
+        self.remember_peer(event.chat_id, getattr(event, "input_chat", None))
+
+        return await self.send_message(event.chat_id, message, **kwargs)
+
+    async def reply(self, event: object, message: str, **kwargs) -> object:
+        kwargs.setdefault("reply_to", event.message.id)
+
+        return await self.respond(event, message, **kwargs)
+
+    def remember_peer(self, chat_id: int, input_peer: object) -> None:
+        if input_peer is None or chat_id in self._peers:
+            return
+
+        self._peers[chat_id] = input_peer
+
+        if len(self._peers) > self.max_chats:
+            self._peers.popitem(last=False)
+
+    async def resolve(self, entity: object) -> object:
+        if not isinstance(entity, int):
+            return entity
+
+        peer = self._peers.get(entity)
+
+        if peer is None:
+            peer = await self.client.get_input_entity(entity)
+            self.remember_peer(entity, peer)
+
+        return peer
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+
+        while True:
+            if not (self._heap or self._parked):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self._global.delay(now=now))
+
+            if delay > 0:
+                await self._sleep(delay)
+                continue
+
+            job, delay = self._pop_ready(now)
+
+            if job is None:
+                await self._sleep(delay)
+                continue
+
+            self._global.consume(now=now)
+            if job.chat_limited:
+                self._bucket(job.chat_id).consume(now=now)
+
+            self._arm(job.chat_id, now)
+
+            await self._in_flight.acquire()
+            loop.create_task(self._execute(job))
+
+    def _push(self, job: _Job) -> None:
+        heapq.heappush(self._heap, job)
+        self._wakeup.set()
+
+    def _bucket(self, chat_id: object) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+
+        if bucket is None:
+            # Groups, supergroups and channels have negative ids
+            if isinstance(chat_id, int) and chat_id < 0:
+                rate, burst = self.limits["group_rate"], self.limits["group_burst"]
+            else:
+                rate, burst = self.limits["chat_rate"], self.limits["chat_burst"]
+
+            bucket = self._buckets[chat_id] = TokenBucket(rate, burst)
+
+            if len(self._buckets) > self.max_chats:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(chat_id)
+
+        return bucket
+
+    def _chat_delay(self, job: _Job, now: float) -> float:
+        delay = 0.0
+        paused_until = self._chat_paused_until.get(job.chat_id)
+
+        if paused_until is not None:
+            if paused_until > now:
+                delay = paused_until - now
+            else:
+                del self._chat_paused_until[job.chat_id]
+
+        if job.chat_limited:
+            delay = max(delay, self._bucket(job.chat_id).delay(now=now))
+
+        return delay
+
+    def _pop_ready(self, now: float) -> tuple:
+        """Pop the most important job whose chat may send right now."""
+        self._release(now)
+
+        while self._heap:
+            job = heapq.heappop(self._heap)
+
+            if job.future.done():
+                # The caller gave up waiting
+                self._arm(job.chat_id, now)
+                continue
+
+            chat_delay = self._chat_delay(job, now)
+
+            if chat_delay <= 0:
+                return job, 0.0
+
+            self._park(job, now + chat_delay)
+
+        delay = self._timers[0][0] - now if self._timers else float("inf")
+
+        return None, delay
+
+    def _park(self, job: _Job, ready_at: float) -> None:
+        heapq.heappush(self._parked.setdefault(job.chat_id, []), job)
+        self._parked_count += 1
+
+        if job.chat_id not in self._armed:
+            self._armed.add(job.chat_id)
+            heapq.heappush(self._timers, (ready_at, next(self._seq), job.chat_id))
+
+    def _arm(self, chat_id: object, now: float) -> None:
+        """Release the next parked job of chat once it may send again."""
+        parked = self._parked.get(chat_id)
+
+        if parked and chat_id not in self._armed:
+            self._armed.add(chat_id)
+            ready_at = now + self._chat_delay(parked[0], now)
+            heapq.heappush(self._timers, (ready_at, next(self._seq), chat_id))
+
+    def _release(self, now: float) -> None:
+        """Move the next job of every chat that may send again to the queue.
+
+        The other jobs of the chat stay parked until that one was sent.
+        """
+        while self._timers and self._timers[0][0] <= now:
+            _, _, chat_id = heapq.heappop(self._timers)
+            self._armed.discard(chat_id)
+
+            parked = self._parked[chat_id]
+            heapq.heappush(self._heap, heapq.heappop(parked))
+            self._parked_count -= 1
+
+            if not parked:
+                del self._parked[chat_id]
+
+    async def _sleep(self, delay: float) -> None:
+        # New jobs wake us up, they might be for a chat that can send now
+        self._wakeup.clear()
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _execute(self, job: _Job) -> None:
+        try:
+            entity = await self.resolve(job.chat_id)
+            result = await getattr(self.client, job.method)(
+                entity, *job.args, **job.kwargs
+            )
+        except SlowModeWaitError as e:
+            self._chat_paused_until[job.chat_id] = time.monotonic() + e.seconds
+            self._push(job)
+        except FloodWaitError as e:
+            logger.warning("FloodWait of %ss on %s", e.seconds, job.method)
+            record_flood_wait(job.method, e.seconds)
+
+            self._paused_until = max(self._paused_until, time.monotonic() + e.seconds)
+            self._push(job)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight.release()
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
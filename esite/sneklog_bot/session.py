@@ -0,0 +1,205 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, transaction
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession
+from telethon.tl.types import updates
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseSession(MemorySession):
+    """Telethon session stored in the project database.
+
+    Everything is kept in memory like MemorySession. The stored session is
+    loaded once when the client is created, changes are written back
+    whenever Telethon calls `save()` or `close()`. The writes run on a
+    single worker thread, in order, because Telethon calls these methods
+    from inside the event loop where the ORM must not be used.
+    """
+
+    # ctor
+    def __init__(self, name: str = "sneklog_bot") -> None:
+        super().__init__()
+        self.name = name
+
+        self._entity_rows = {}
+        self._dirty_entities = {}
+        self._dirty_states = {}
+        self._session_dirty = False
+        self._executor = None
+
+        self.load()
+
+    # props
+    @MemorySession.auth_key.setter
+    def auth_key(self, value: AuthKey) -> None:
+        self._auth_key = value
+        self._session_dirty = True
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value: int) -> None:
+        self._takeout_id = value
+        self._session_dirty = True
+
+    # meths
+    def load(self) -> None:
+        """Read the stored session, must not be called from the event loop."""
+        from .models import TelegramSession
+
+        session = TelegramSession.objects.filter(name=self.name).first()
+
+        if session is None:
+            return
+
+        self._dc_id = session.dc_id
+        self._server_address = session.server_address or None
+        self._port = session.port
+        self._takeout_id = session.takeout_id
+
+        if session.auth_key:
+            self._auth_key = AuthKey(data=bytes(session.auth_key))
+
+        for entity in session.entities.all().iterator():
+            self._entity_rows[entity.entity_id] = (
+                entity.entity_id,
+                entity.access_hash,
+                entity.username,
+                entity.phone,
+                entity.name,
+            )
+
+        self._entities = set(self._entity_rows.values())
+
+        for state in session.update_states.all():
+            self._update_states[state.entity_id] = updates.State(
+                pts=state.pts,
+                qts=state.qts,
+                date=state.date,
+                seq=state.seq,
+                unread_count=state.unread_count,
+            )
+
+    def set_dc(self, dc_id: int, server_address: str, port: int) -> None:
+        super().set_dc(dc_id, server_address, port)
+        self._session_dirty = True
+
+    def set_update_state(self, entity_id: int, state: object) -> None:
+        super().set_update_state(entity_id, state)
+        self._dirty_states[entity_id] = state
+
+    def process_entities(self, tlo: object) -> None:
+        for row in self._entities_to_rows(tlo):
+            old = self._entity_rows.get(row[0])
+
+            if old == row:
+                continue
+
+            # Replace instead of adding a second row for the same id
+            self._entities.discard(old)
+            self._entities.add(row)
+            self._entity_rows[row[0]] = self._dirty_entities[row[0]] = row
+
+    def save(self) -> None:
+        if not (self._session_dirty or self._dirty_entities or self._dirty_states):
+            return
+
+        snapshot = (
+            {
+                "dc_id": self._dc_id,
+                "server_address": self._server_address or "",
+                "port": self._port,
+                "auth_key": self._auth_key.key if self._auth_key else None,
+                "takeout_id": self._takeout_id,
+            },
+            list(self._dirty_entities.values()),
+            dict(self._dirty_states),
+        )
+
+        self._session_dirty = False
+        self._dirty_entities = {}
+        self._dirty_states = {}
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="sneklog_bot-session"
+            )
+
+        self._executor.submit(self._persist, *snapshot)
+
+    def close(self) -> None:
+        """Write all pending changes and wait until they are stored."""
+        self.save()
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def delete(self) -> None:
+        from .models import TelegramSession
+
+        self.close()
+        TelegramSession.objects.filter(name=self.name).delete()
+
+    def _persist(self, fields: dict, entities: list, states: dict) -> None:
+        close_old_connections()
+
+        try:
+            self.persist(fields, entities, states)
+        except Exception as e:
+            logger.error("Could not store the Telegram session: %r", e)
+        finally:
+            close_old_connections()
+
+    @transaction.atomic
+    def persist(self, fields: dict, entities: list, states: dict) -> None:
+        from .models import TelegramSession, TelegramSessionEntity, TelegramUpdateState
+
+        session, _ = TelegramSession.objects.update_or_create(
+            name=self.name, defaults=fields
+        )
+
+        if entities:
+            existing = dict(
+                session.entities.filter(
+                    entity_id__in=[row[0] for row in entities]
+                ).values_list("entity_id", "pk")
+            )
+            objs = [
+                TelegramSessionEntity(
+                    pk=existing.get(entity_id),
+                    session=session,
+                    entity_id=entity_id,
+                    access_hash=access_hash,
+                    username=username,
+                    phone=phone,
+                    name=name,
+                )
+                for entity_id, access_hash, username, phone, name in entities
+            ]
+
+            TelegramSessionEntity.objects.bulk_create(
+                [obj for obj in objs if obj.pk is None]
+            )
+            TelegramSessionEntity.objects.bulk_update(
+                [obj for obj in objs if obj.pk is not None],
+                ["access_hash", "username", "phone", "name"],
+            )
+
+        for entity_id, state in states.items():
+            TelegramUpdateState.objects.update_or_create(
+                session=session,
+                entity_id=entity_id,
+                defaults={
+                    "pts": state.pts,
+                    "qts": state.qts,
+                    "date": state.date,
+                    "seq": state.seq,
+                    "unread_count": state.unread_count,
+                },
+            )
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
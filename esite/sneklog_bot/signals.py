@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import managed_chat_ids
+from .models import TelegramChatGroup
+
+
+@receiver(post_save, sender=TelegramChatGroup)
+def remember_chat_id(sender, instance, **kwargs):
+    transaction.on_commit(lambda: managed_chat_ids.add(instance.chat_id))
+
+
+@receiver(post_delete, sender=TelegramChatGroup)
+def forget_chat_id(sender, instance, **kwargs):
+    transaction.on_commit(lambda: managed_chat_ids.discard(instance.chat_id))
+
+
+# SPDX-License-Identifier: (EUPL-1.2)
+# Copyright © 2021 snek.at
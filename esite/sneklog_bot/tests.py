@@ -1,6 +1,349 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from telethon.errors import SlowModeWaitError
+
+from .download_from_url import Downloader, DownloadError
+from .fake_client import FakeClient
+from .membership import MembershipTracker
+from .models import ChatMembership, TelegramChatGroup
+from .roster import ROSTER_MAX, ROSTER_SIZE, Roster
+from .scheduler import OutboundScheduler
+
+URL = "https://files.example.com/lecture.pdf"
+
+
+class RangeFileServer:
+    """Serve data like a static file server that supports Range requests.
+
+    With `fail_after` the first GET breaks off after that many bytes.
+    """
+
+    # ctor
+    def __init__(self, data: bytes, fail_after: int = None) -> None:
+        self.data = data
+        self.fail_after = fail_after
+        # Range header of every GET, None for full downloads
+        self.ranges = []
+
+    # meths
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        headers = {"Accept-Ranges": "bytes", "ETag": '"v1"'}
+
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(self.data))
+            return httpx.Response(200, headers=headers)
+
+        range_header = request.headers.get("Range")
+        self.ranges.append(range_header)
+
+        if range_header:
+            start, end = range_header[len("bytes=") :].split("-")
+            status, body = 206, self.data[int(start) : int(end) + 1]
+        else:
+            status, body = 200, self.data
+
+        if self.fail_after is not None:
+            fail_after, self.fail_after = self.fail_after, None
+            return httpx.Response(
+                status, headers=headers, content=self.break_off(body[:fail_after])
+            )
+
+        return httpx.Response(status, headers=headers, content=body)
+
+    @staticmethod
+    async def break_off(body: bytes):
+        yield body
+        raise httpx.ReadError("Connection reset by peer")
+
+
+class DownloaderTest(SimpleTestCase):
+    data = bytes(range(256)) * 40
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "lecture.pdf")
+
+    async def download(self, server: RangeFileServer, **options) -> str:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+            return await Downloader(
+                URL, self.path, client=client, chunk_size=1000, **options
+            ).run()
+
+    def assertDownloaded(self, digest: str) -> None:
+        self.assertEqual(digest, hashlib.sha256(self.data).hexdigest())
+
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+        self.assertFalse(os.path.exists(f"{self.path}.part"))
+        self.assertFalse(os.path.exists(f"{self.path}.part.json"))
+
+    async def test_parallel_ranges(self):
+        server = RangeFileServer(self.data)
+
+        digest = await self.download(server, parallel=4, min_part_size=1024)
+
+        self.assertDownloaded(digest)
+        self.assertEqual(
+            sorted(server.ranges),
+            [
+                "bytes=0-2559",
+                "bytes=2560-5119",
+                "bytes=5120-7679",
+                "bytes=7680-10239",
+            ],
+        )
+
+    async def test_small_file_in_one_request(self):
+        server = RangeFileServer(self.data)
+
+        digest = await self.download(server)
+
+        self.assertDownloaded(digest)
+        self.assertEqual(server.ranges, [None])
+
+    async def test_resume(self):
+        server = RangeFileServer(self.data, fail_after=3000)
+
+        with self.assertRaises(DownloadError):
+            await self.download(server, retries=0)
+
+        with open(f"{self.path}.part.json") as f:
+            self.assertEqual(json.load(f)["ranges"], [[0, 3000, len(self.data)]])
+
+        digest = await self.download(server)
+
+        self.assertDownloaded(digest)
+        self.assertEqual(server.ranges, [None, f"bytes=3000-{len(self.data) - 1}"])
+
+
+class RecordingClient:
+    """Send nothing, record (chat, message) of every sent message.
+
+    The first `slow_mode` sends to a chat raise a SlowModeWaitError.
+    """
+
+    # ctor
+    def __init__(self, slow_mode: dict = None) -> None:
+        self.slow_mode = dict(slow_mode or {})
+        self.sent = []
+
+    # meths
+    async def get_input_entity(self, entity: object) -> object:
+        return entity
+
+    async def send_message(self, entity: object, message: str, **kwargs) -> str:
+        if self.slow_mode.get(entity):
+            self.slow_mode[entity] -= 1
+            raise SlowModeWaitError(request=None, capture=1)
+
+        self.sent.append((entity, message))
+
+        return message
+
+
+class OutboundSchedulerTest(SimpleTestCase):
+    limits = {
+        "global_rate": 1000.0,
+        "global_burst": 1000,
+        "chat_rate": 1.0,
+        "chat_burst": 1,
+    }
+
+    async def run_scheduler(self, client: RecordingClient) -> OutboundScheduler:
+        scheduler = OutboundScheduler(client, **self.limits)
+        task = asyncio.ensure_future(scheduler.run())
+        self.addCleanup(task.cancel)
+
+        return scheduler
+
+    async def test_priority(self):
+        client = RecordingClient()
+        scheduler = OutboundScheduler(client, **self.limits)
+
+        sent = [
+            scheduler.submit(scheduler.BROADCAST, 1, "send_message", "broadcast"),
+            scheduler.submit(scheduler.REPLY, 2, "send_message", "reply"),
+        ]
+        self.addCleanup(asyncio.ensure_future(scheduler.run()).cancel)
+        await asyncio.gather(*sent)
+
+        self.assertEqual(client.sent, [(2, "reply"), (1, "broadcast")])
+
+    async def test_waiting_chat_does_not_block(self):
+        client = RecordingClient()
+        scheduler = await self.run_scheduler(client)
+
+        first = [scheduler.send_message(5, f"m{i}") for i in range(3)]
+        other = scheduler.send_message(6, "other")
+        sending = asyncio.gather(*first, other)
+
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(client.sent, [(5, "m0"), (6, "other")])
+        # Parked until chat 5 has a token again
+        self.assertEqual(scheduler.depth, 2)
+
+        await asyncio.wait_for(sending, timeout=5)
+
+        self.assertEqual(client.sent, [(5, "m0"), (6, "other"), (5, "m1"), (5, "m2")])
+        self.assertEqual(scheduler.depth, 0)
+
+    async def test_slow_mode(self):
+        client = RecordingClient(slow_mode={-200: 1})
+        scheduler = await self.run_scheduler(client)
+
+        slow = scheduler.send_message(-200, "slow")
+        await asyncio.sleep(0.1)
+        other = scheduler.send_message(6, "other")
+
+        await asyncio.wait_for(other, timeout=0.5)
+        self.assertEqual(client.sent, [(6, "other")])
+
+        # Sent again once the slow mode wait is over
+        await asyncio.wait_for(slow, timeout=5)
+        self.assertEqual(client.sent, [(6, "other"), (-200, "slow")])
+        self.assertEqual(scheduler._chat_paused_until, {})
+
+
+def run_in_test_thread(func, *args, **kwargs):
+    # The thread pool would not see the test transaction
+    return sync_to_async(func)(*args, **kwargs)
+
+
+@mock.patch("esite.sneklog_bot.membership.run_in_db_pool", run_in_test_thread)
+class MembershipTrackerTest(TestCase):
+    chat_id = -100
+
+    def setUp(self):
+        TelegramChatGroup.objects.create(chat_id=self.chat_id, name="snek")
+        ChatMembership.objects.bulk_create(
+            [
+                ChatMembership(chat_id=self.chat_id, telegram_user_id=user_id)
+                for user_id in [1, 2, 3]
+            ]
+        )
+
+        self.client = FakeClient()
+        self.tracker = MembershipTracker(self.client, sweep_interval=60 * 60)
+
+    def stored(self) -> set:
+        return set(
+            ChatMembership.objects.filter(chat_id=self.chat_id).values_list(
+                "telegram_user_id", flat=True
+            )
+        )
+
+    def test_reconcile(self):
+        self.assertEqual(self.tracker.reconcile(self.chat_id, {2, 3, 4}), (1, 1))
+
+        self.assertEqual(self.stored(), {2, 3, 4})
+        self.assertIsNotNone(TelegramChatGroup.objects.get().swept_at)
+
+    def test_reconcile_keeps_flushed(self):
+        # 1 joined and 4 left after the participants were fetched
+        self.assertEqual(
+            self.tracker.reconcile(self.chat_id, {2, 3, 4}, flushed={1, 4}), (0, 0)
+        )
+
+        self.assertEqual(self.stored(), {1, 2, 3})
+
+    async def test_flush_during_sweep(self):
+        self.client.participants[self.chat_id] = [2, 3, 4]
+        iter_participants = self.client.iter_participants
+
+        async def join_while_listing(chat_id, **kwargs):
+            async for user in iter_participants(chat_id, **kwargs):
+                if user.id == 3:
+                    self.tracker.joined(chat_id, [5])
+                    self.tracker.left(chat_id, [4])
+                    await self.tracker.flush()
+
+                yield user
+
+        self.client.iter_participants = join_while_listing
+
+        await self.tracker.sweep()
+
+        self.assertEqual(await sync_to_async(self.stored)(), {2, 3, 5})
+        self.assertEqual(self.tracker._sweeping, {})
+
+    async def test_skip_recent_sweeps(self):
+        self.client.participants[self.chat_id] = [2, 3, 4]
+        await sync_to_async(TelegramChatGroup.objects.update)(
+            swept_at=timezone.now() - timedelta(minutes=20)
+        )
+
+        delay = await self.tracker.sweep()
+
+        self.assertAlmostEqual(delay, 40 * 60, delta=60)
+        self.assertEqual(self.client.calls["iter_participants"], 0)
+        self.assertEqual(await sync_to_async(self.stored)(), {1, 2, 3})
+
+
+class RosterTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(directory.name, "matrikelnummer.roster")
+
+        self.roster = Roster(self.path)
+        self.roster.check_interval = 0
+
+    def test_missing(self):
+        self.assertFalse(self.roster.available)
+        self.assertNotIn(11700000, self.roster)
+
+    def test_lookup(self):
+        matrikelnummern = [0, 1234567, 11700000, 11700000, ROSTER_MAX]
+
+        self.assertEqual(Roster.write(matrikelnummern, self.path), 4)
+        self.assertEqual(os.path.getsize(self.path), ROSTER_SIZE)
+
+        self.assertTrue(self.roster.available)
+        for matrikelnummer in matrikelnummern:
+            self.assertIn(matrikelnummer, self.roster)
+        for matrikelnummer in [1, 11700001, -1, ROSTER_MAX + 1]:
+            self.assertNotIn(matrikelnummer, self.roster)
+
+    def test_replace(self):
+        Roster.write([11700000], self.path)
+        self.assertIn(11700000, self.roster)
+
+        Roster.write([11800000], self.path)
+
+        self.assertNotIn(11700000, self.roster)
+        self.assertIn(11800000, self.roster)
+
+    def test_out_of_range(self):
+        Roster.write([11700000], self.path)
+
+        with self.assertRaises(ValueError):
+            Roster.write([11800000, ROSTER_MAX + 1], self.path)
+
+        # The old roster is kept and no temporary file is left behind
+        self.assertEqual(os.listdir(self.directory), ["matrikelnummer.roster"])
+        self.assertIn(11700000, self.roster)
+
+    def test_wrong_size(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\xff" * 16)
+
+        self.assertFalse(self.roster.available)
+        self.assertNotIn(1, self.roster)
 
-# Create your tests here.
 
 # SPDX-License-Identifier: (EUPL-1.2)
 # Copyright © 2021 snek.at
@@ -27,6 +27,9 @@ from wagtail.core import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 from wagtail.utils.urlpatterns import decorate_urlpatterns
 
+from esite.core import views as core_views
+from esite.jaen_cms import views as jaen_views
+
 # from esite.search import views as search_views
 
 
@@ -36,11 +39,18 @@ private_urlpatterns = [
     path("django-admin/", admin.site.urls),
     path("admin/", include(wagtailadmin_urls)),
     path("documents/", include(wagtaildocs_urls)),
+    path("metrics/", core_views.metrics),
+    path("jaen/publish/<uuid:job_id>/", jaen_views.publish_job),
 ]
 
 
 # Public URLs that are meant to be cached.
 urlpatterns = [
+    url(
+        r"^jaen/data/(?P<checksum>[0-9a-f]{64})\.json$",
+        jaen_views.jaen_data,
+        name="jaen_data",
+    ),
     # path("sitemap.xml", sitemap),
     # path("favicon.ico", favicon),
     # path("robots.txt", robots),